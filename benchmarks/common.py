@@ -0,0 +1,102 @@
+"""
+Shared helpers of the benchmark suite: fake asyncpg Records, timers and JSON results.
+"""
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+
+class FakeRecord(Mapping):
+    """
+    Tuple-backed, read-only mapping like asyncpg.Record.
+    """
+
+    __slots__ = ("_index", "_row")
+
+    def __init__(self, index, row):
+        self._index = index
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._row[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._row)
+
+
+class Results:
+    """
+    Collects benchmark results, printed as they come and saved as JSON.
+    Every result is {"name", "unit", "value", ...}, lower is better unless noted.
+    """
+
+    def __init__(self, suite: str):
+        self.suite = suite
+        self.results: List[Dict[str, Any]] = []
+
+    def add(self, name: str, value: float, unit: str, **extra: Any):
+        self.results.append({"name": name, "value": value, "unit": unit, **extra})
+        details = " ".join(f"{key}={value}" for key, value in extra.items())
+        print(f"{name:<40} {value:>14.1f} {unit:<8} {details}")
+
+    def dump(self, path: str):
+        with open(path, "w") as file:
+            json.dump(
+                {"suite": self.suite, "environment": environment(), "results": self.results},
+                file,
+                indent=2,
+            )
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+    }
+
+
+def timeit(function: Callable[[], Any], number: int, repeat: int = 5) -> Dict[str, float]:
+    """
+    Runs function number times per repeat, returns the best and median ns per call.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter_ns() - start) / number)
+    return {"best": min(timings), "median": statistics.median(timings)}
+
+
+def percentiles(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {
+        f"p{percentile}": timings[min(len(timings) - 1, int(len(timings) * percentile / 100))]
+        for percentile in (50, 95, 99)
+    }
+
+
+def arguments(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions, the best one is reported")
+    return parser
@@ -0,0 +1,47 @@
+"""
+Compares two result files of the same suite, exits with 1 on regressions.
+
+    python benchmarks/compare.py base.json new.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str):
+    with open(path) as file:
+        data = json.load(file)
+    return data, {result["name"]: result for result in data["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    base_data, base = load(args.base)
+    new_data, new = load(args.new)
+    print(f"{base_data['environment']['commit']} -> {new_data['environment']['commit']}")
+
+    regressions = 0
+    for name, result in new.items():
+        if name not in base:
+            print(f"{name:<40} {'new':>14} {result['value']:>14.1f} {result['unit']}")
+            continue
+        before, after = base[name]["value"], result["value"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improvement"
+        print(f"{name:<40} {before:>14.1f} {after:>14.1f} {result['unit']:<8} {change:>+8.1%} {flag}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Macro-benchmarks against a throwaway PostgreSQL database: the bench_users table is dropped and recreated.
+
+    python benchmarks/macro.py --dsn postgresql://postgres@localhost/postgres [--json results.json]
+
+The DSN can also be set with BLADEORM_BENCH_DSN.
+"""
+from common import Results, arguments, percentiles
+from bladeorm.model import Text, Int, Float, Bool, Serial
+from bladeorm.client import Client
+import asyncio
+import os
+import random
+import time
+
+
+client = Client()
+
+
+@client.model
+class BenchUser:
+    name: Text
+    last_name: Text
+    age: Int.index
+    score: Float
+    active: Bool
+    id: Serial.primary_key = None
+
+
+def make_users(count: int, offset: int = 0):
+    return [
+        BenchUser(name=f"name{i}", last_name=f"last{i}", age=i % 90, score=i / 3, active=i % 2 == 0)
+        for i in range(offset, offset + count)
+    ]
+
+
+def report(results: Results, name: str, timings, **extra):
+    total = sum(timings)
+    results.add(
+        name,
+        total / len(timings) * 1e6,
+        "us/op",
+        ops=round(len(timings) / total),
+        **{key: round(value * 1e6) for key, value in percentiles(timings).items()},
+        **extra,
+    )
+
+
+async def bench_save(results: Results, count: int):
+    timings = []
+    for user in make_users(count, 10_000_000):
+        start = time.perf_counter()
+        await user.save()
+        timings.append(time.perf_counter() - start)
+    report(results, "save.single_row", timings)
+
+
+async def bench_bulk_load(results: Results, rows: int, repeat: int):
+    timings = []
+    for attempt in range(repeat):
+        users = make_users(rows, attempt * rows)
+        start = time.perf_counter()
+        await BenchUser.insert_many(users)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    results.add("insert_many", best / rows * 1e6, "us/row", ops=round(rows / best), rows=rows)
+
+
+async def bench_fetch(results: Results, count: int):
+    timings = []
+    fetched = 0
+    for i in range(count):
+        start = time.perf_counter()
+        fetched += len(await BenchUser((BenchUser.age == i % 90) & (BenchUser.active == True)).fetch())
+        timings.append(time.perf_counter() - start)
+    report(results, "fetch.filtered", timings, rows_per_query=round(fetched / count))
+
+
+async def bench_concurrent_fetchone(results: Results, tasks: int, count: int, ids: int):
+    timings = []
+
+    async def worker():
+        for _ in range(count):
+            start = time.perf_counter()
+            await BenchUser(BenchUser.id == random.randint(1, ids)).fetchone()
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(tasks)])
+    elapsed = time.perf_counter() - start
+    results.add(
+        f"fetchone.concurrent[tasks={tasks}]",
+        elapsed / len(timings) * 1e6,
+        "us/op",
+        ops=round(len(timings) / elapsed),
+        **{key: round(value * 1e6) for key, value in percentiles(timings).items()},
+    )
+
+
+async def run(args):
+    results = Results("macro")
+    await client.start(args.dsn, min_size=args.pool, max_size=args.pool)
+    try:
+        async with client.acquire() as connection:
+            await connection.execute(f"DROP TABLE IF EXISTS {BenchUser.table_name}")
+        await client.create_tables()
+
+        await bench_bulk_load(results, args.rows, args.repeat)
+        async with client.acquire() as connection:
+            await connection.execute(f"ANALYZE {BenchUser.table_name}")
+        await bench_save(results, args.count)
+        await bench_fetch(results, args.count)
+        for tasks in (1, args.tasks):
+            await bench_concurrent_fetchone(results, tasks, args.count // tasks or 1, args.rows)
+
+        async with client.acquire() as connection:
+            await connection.execute(f"DROP TABLE {BenchUser.table_name}")
+    finally:
+        await client.stop()
+
+    if args.json:
+        results.dump(args.json)
+
+
+def main():
+    parser = arguments(__doc__)
+    parser.add_argument("--dsn", default=os.environ.get("BLADEORM_BENCH_DSN"), help="PostgreSQL DSN")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows bulk loaded per repetition")
+    parser.add_argument("--count", type=int, default=2000, help="queries per benchmark")
+    parser.add_argument("--tasks", type=int, default=32, help="concurrent coroutines")
+    parser.add_argument("--pool", type=int, default=10, help="connection pool size")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or BLADEORM_BENCH_DSN is required")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Micro-benchmarks, no database needed: query building, hydration and dirty tracking.
+
+    python benchmarks/micro.py [--rows 100000] [--json results.json]
+"""
+from common import FakeRecord, Results, arguments, timeit
+from bladeorm.model import Text, Int, Float, Bool, Serial
+from bladeorm.client import Client
+from bladeorm.utils import ValuesManager
+import time
+import tracemalloc
+
+
+client = Client()
+
+
+@client.model
+class User:
+    id: Serial.primary_key
+    name: Text
+    last_name: Text
+    age: Int
+    score: Float
+    active: Bool
+
+
+def make_rows(count: int):
+    index = {name: position for position, name in enumerate(User.get_columns())}
+    return [
+        FakeRecord(index, (i, f"name{i}", f"last{i}", i % 90, i / 3, i % 2 == 0))
+        for i in range(count)
+    ]
+
+
+def deep_condition(depth: int):
+    condition = User.age > 0
+    for i in range(depth):
+        condition = condition & ((User.name == f"name{i}") | (User.score >= i))
+    return condition
+
+
+def rebuild(executor):
+    """
+    Renders the SELECT of fetch without the query cache, the baseline of fetch_query.cached.
+    """
+    manager = ValuesManager()
+    return executor._select(manager, (), lambda tail: ""), manager.get_storage()
+
+
+def bench_build(results: Results, repeat: int):
+    for depth in (0, 1, 10, 50):
+        # depth 0 is a single equality, the common point lookup
+        make = (lambda: User(User.id == 5)) if depth == 0 else (lambda: User(deep_condition(depth)))
+        executor = make()
+        condition = executor._where
+        number = max(100, 20_000 // max(depth, 1))
+
+        timing = timeit(lambda: condition.build(), number, repeat)
+        results.add(f"operator.build[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+        # the path taken by fetch: shape lookup in the query cache and parameter binding
+        timing = timeit(lambda: executor._fetch_query(()), number, repeat)
+        results.add(f"fetch_query.cached[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+        timing = timeit(lambda: rebuild(executor), number, repeat)
+        results.add(f"fetch_query.rebuild[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+        # a new condition per query, as in application code
+        timing = timeit(lambda: make()._fetch_query(()), number, repeat)
+        results.add(f"fetch_query.cached.new[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+        timing = timeit(lambda: rebuild(make()), number, repeat)
+        results.add(f"fetch_query.rebuild.new[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+        timing = timeit(make, max(10, number // 10), repeat)
+        results.add(f"operator.create[depth={depth}]", timing["best"], "ns/op", median=round(timing["median"]))
+
+
+def bench_hydration(results: Results, rows, repeat: int):
+    hydrators = {
+        "legacy": lambda row: User.create_instance(dict(row), True),
+        "record": User.from_record,
+    }
+    for name, hydrate in hydrators.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            instances = [hydrate(row) for row in rows]
+            elapsed = time.perf_counter_ns() - start
+            best = elapsed if best is None else min(best, elapsed)
+            del instances
+
+        tracemalloc.start()
+        instances = [hydrate(row) for row in rows]
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del instances
+
+        results.add(f"hydrate.{name}", best / len(rows), "ns/row", memory=round(allocated / len(rows)))
+
+
+def bench_dirty_tracking(results: Results, rows, repeat: int):
+    instances = {
+        "created": User(name="John", last_name="Doe", age=20, score=1.0, active=True),
+        "record": User.from_record(rows[0]),
+    }
+    for name, instance in instances.items():
+        def update():
+            instance.age = 21
+            instance.score = 2.0
+
+        timing = timeit(update, 50_000, repeat)
+        results.add(f"setattr.{name}", timing["best"] / 2, "ns/op", median=round(timing["median"] / 2))
+
+        timing = timeit(lambda: instance.age, 50_000, repeat)
+        results.add(f"getattr.{name}", timing["best"], "ns/op", median=round(timing["median"]))
+
+
+def main():
+    parser = arguments(__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows hydrated")
+    args = parser.parse_args()
+
+    results = Results("micro")
+    rows = make_rows(args.rows)
+    bench_build(results, args.repeat)
+    bench_hydration(results, rows, args.repeat)
+    bench_dirty_tracking(results, rows, args.repeat)
+
+    if args.json:
+        results.dump(args.json)
+
+
+if __name__ == "__main__":
+    main()
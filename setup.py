@@ -14,4 +14,8 @@ setup(
     install_requires=[
         "asyncpg",
     ],
+    extras_require={
+        "numpy": ["numpy"],
+        "json": ["orjson"],
+    },
 )
@@ -0,0 +1,220 @@
+from collections import deque
+from contextvars import ContextVar
+from itertools import count
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from time import perf_counter
+import asyncio
+import bisect
+
+
+_current_class: ContextVar[Optional[str]] = ContextVar("bladeorm_query_class", default=None)
+
+
+class Overloaded(RuntimeError):
+    """
+    Raised instead of queueing a query when its class queue is full, or when it waited too long.
+    """
+
+
+class QueryClass:
+    """
+    Named class of queries sharing a concurrency limit and a priority.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int = None,
+        priority: int = 0,
+        max_queue: int = None,
+        max_wait: float = None,
+        timeout: float = None,
+        samples: int = 1024,
+    ):
+        """
+        :param limit: max queries of the class running at once, None for no limit but the capacity
+        :param priority: lower values are admitted first when queries wait
+        :param max_queue: max waiting queries, more are rejected with Overloaded
+        :param max_wait: max seconds a query waits before being rejected with Overloaded
+        :param timeout: default timeout in seconds of the queries, they are cancelled on the server too
+        :param samples: waits kept for the percentiles
+        """
+        self.name = name
+        self.limit = limit
+        self.priority = priority
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self._wait_total = 0.0
+        self._waits: Deque[float] = deque(maxlen=samples)
+
+    def waited(self, seconds: float):
+        self._wait_total += seconds
+        self._waits.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "limit": self.limit,
+            "priority": self.priority,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_mean": self._wait_total / self.admitted if self.admitted else 0.0,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+
+class Admission:
+    """
+    Admits the queries of a Client by class: at most capacity run at once, and waiting
+    queries get a connection by priority, then in arrival order.
+    """
+
+    def __init__(self, classes: Iterable[QueryClass] = (), capacity: int = None):
+        """
+        :param classes: query classes, a default class without limits is added if missing
+        :param capacity: max queries running at once, the max size of the primary pool by default
+        """
+        self.classes: Dict[str, QueryClass] = {query_class.name: query_class for query_class in classes}
+        self.classes.setdefault("default", QueryClass("default"))
+        self.capacity = capacity
+        self.running = 0
+        # (priority, arrival, future, class), sorted
+        self._waiters: List[Tuple[int, int, asyncio.Future, QueryClass]] = []
+        self._arrivals = count()
+
+    def get(self, name: str = None) -> QueryClass:
+        """
+        Returns the class named name, else the one of the current scope, else the default class.
+        """
+        name = name or _current_class.get() or "default"
+        query_class = self.classes.get(name)
+        if query_class is None:
+            raise ValueError(f"Unknown query class {name}")
+        return query_class
+
+    def _can_run(self, query_class: QueryClass) -> bool:
+        return (self.capacity is None or self.running < self.capacity) and (
+            query_class.limit is None or query_class.running < query_class.limit
+        )
+
+    def _start(self, query_class: QueryClass):
+        self.running += 1
+        query_class.running += 1
+        query_class.admitted += 1
+
+    async def acquire(self, query_class: QueryClass):
+        if self._can_run(query_class):
+            self._start(query_class)
+            query_class.waited(0.0)
+            return
+        if query_class.max_queue is not None and query_class.queued >= query_class.max_queue:
+            query_class.shed += 1
+            raise Overloaded(f"{query_class.name} queue is full ({query_class.queued} waiting)")
+
+        started = perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        waiter = (query_class.priority, next(self._arrivals), future, query_class)
+        # arrivals are unique, futures are never compared
+        bisect.insort(self._waiters, waiter)
+        query_class.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), query_class.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # admitted while being cancelled, give the slot back
+                self.release(query_class)
+            else:
+                future.cancel()
+                self._waiters.remove(waiter)
+                query_class.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                query_class.shed += 1
+                raise Overloaded(f"{query_class.name} waited more than {query_class.max_wait}s") from None
+            raise
+        query_class.waited(perf_counter() - started)
+
+    def release(self, query_class: QueryClass):
+        self.running -= 1
+        query_class.running -= 1
+        index = 0
+        while index < len(self._waiters) and (self.capacity is None or self.running < self.capacity):
+            _, _, future, waiting_class = self._waiters[index]
+            if not self._can_run(waiting_class):
+                index += 1
+                continue
+            del self._waiters[index]
+            waiting_class.queued -= 1
+            self._start(waiting_class)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the running queries and the capacity, with the stats of each class:
+        running, queued, admitted and shed queries, mean, p95 and max wait in seconds.
+        """
+        return {
+            "running": self.running,
+            "capacity": self.capacity,
+            "classes": {name: query_class.stats() for name, query_class in self.classes.items()},
+        }
+
+
+class AdmittedConnection:
+    """
+    Context manager waiting for the admission of its query class before acquiring a connection.
+    """
+
+    def __init__(self, admission: Admission, query_class: QueryClass, manager: Any):
+        self._admission = admission
+        self._query_class = query_class
+        self._manager = manager
+
+    @property
+    def replica(self) -> Any:
+        return getattr(self._manager, "replica", None)
+
+    async def __aenter__(self) -> Any:
+        await self._admission.acquire(self._query_class)
+        try:
+            return await self._manager.__aenter__()
+        except BaseException:
+            self._admission.release(self._query_class)
+            raise
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        try:
+            await self._manager.__aexit__(exc_type, exc, traceback)
+        finally:
+            self._admission.release(self._query_class)
+
+
+class QueryClassScope:
+    """
+    Runs the queries of a block in a query class, unless they set their own.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._token = None
+
+    def __enter__(self) -> "QueryClassScope":
+        self._token = _current_class.set(self._name)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any):
+        _current_class.reset(self._token)
+
+    async def __aenter__(self) -> "QueryClassScope":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        self.__exit__(exc_type, exc, traceback)
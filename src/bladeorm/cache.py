@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+import sys
+import time
+
+
+# Returned by ResultCache.get on a miss, None is a valid cached result
+MISSING = object()
+
+
+class ResultCache:
+    """
+    Read-through cache for fetched rows, keyed by SQL text and bound parameters.
+    Entries are evicted by LRU, TTL and memory cap, and invalidated per table
+    on writes, also across processes through LISTEN/NOTIFY when a channel is set.
+    """
+
+    def __init__(
+        self,
+        size: int = 1024,
+        ttl: float = 60,
+        max_memory: int = 64 * 1024 * 1024,
+        channel: Optional[str] = "bladeorm_invalidate",
+    ):
+        self._size = size
+        self._ttl = ttl
+        self._max_memory = max_memory
+        self.channel = channel
+
+        # key -> (expiry, tables, rows, memory)
+        self._storage: OrderedDict = OrderedDict()
+        self._tables: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self._memory = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(query: str, values: Tuple[Any, ...]) -> Optional[Hashable]:
+        """
+        Returns the cache key of a query, None if its parameters are not hashable.
+        """
+        key = (query, values)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def generation(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple([self._generations.get(table, 0) for table in tables])
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._storage.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.evictions += 1
+            self.misses += 1
+            return MISSING
+
+        self._storage.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: Hashable, tables: Tuple[str, ...], generation: Tuple[int, ...], rows: Any):
+        """
+        Stores rows, unless one of the tables was written since generation was taken.
+        """
+        if generation != self.generation(tables):
+            return
+
+        memory = _memory(rows)
+        if memory > self._max_memory:
+            return
+
+        if key in self._storage:
+            self._remove(key)
+
+        self._storage[key] = (time.monotonic() + self._ttl, tables, rows, memory)
+        self._memory += memory
+        for table in tables:
+            self._tables.setdefault(table, set()).add(key)
+
+        while len(self._storage) > self._size or self._memory > self._max_memory:
+            self._remove(next(iter(self._storage)))
+            self.evictions += 1
+
+    def invalidate(self, table: str):
+        self._generations[table] = self._generations.get(table, 0) + 1
+        for key in self._tables.pop(table, ()):
+            if key in self._storage:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        for table in list(self._tables):
+            self.invalidate(table)
+
+    def _remove(self, key: Hashable):
+        _, tables, _, memory = self._storage.pop(key)
+        self._memory -= memory
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._storage),
+            "memory": self._memory,
+        }
+
+
+def _memory(rows: Any) -> int:
+    if isinstance(rows, list):
+        return sys.getsizeof(rows) + sum([_memory(row) for row in rows])
+    if hasattr(rows, "values"):
+        return sys.getsizeof(rows) + sum([sys.getsizeof(value) for value in rows.values()])
+    return sys.getsizeof(rows)
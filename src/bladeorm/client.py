@@ -1,34 +1,497 @@
 from .model import wrap_model, Model
+from .session import Session
+from .transaction import Transaction, PinnedConnection
+from .cache import ResultCache
+from .events import QueryEvent, QueryObserver, CallbackObserver
+from .replica import Replica, ReplicaConnection, choose
+from .loader import Loader, LoaderScope
+from .admission import Admission, AdmittedConnection, QueryClassScope
+from .partition import RangePartition
+from .explain import IndexAdvisor
+from .shard import ShardScope, current_shard, on_shard, shard_index
+from .utils import LRUCache, ValuesManager, DatabaseType
+from .jsoncodec import register_json
+from typing import Dict, Iterable, List, Tuple, Callable, Any, Sequence, Optional
+from time import perf_counter
 import asyncpg
+import datetime
+
+
+# create_pool options that asyncpg.connect doesn't take
+POOL_OPTIONS = {"min_size", "max_size", "max_queries", "max_inactive_connection_lifetime", "connect", "setup", "init", "reset", "loop"}
 
 
 class Client:
-    def __init__(self):
+    def __init__(
+        self,
+        query_cache_size: int = 512,
+        result_cache: ResultCache = None,
+        admission: Admission = None,
+        advisor: IndexAdvisor = None,
+    ):
         self._conn_args = []
         self._conn_kwargs = {}
         self.model = wrap_model(self)
         self.models = []
         self._pool = None
+        self._queries = LRUCache(query_cache_size)
+        self.result_cache = result_cache
+        self.admission = admission
+        self.advisor = advisor
+        self._listener = None
+        self._observers: List[QueryObserver] = []
+        self._pool_kwargs = {}
+        self._replicas: List[Replica] = []
+        self._shards: List[Any] = []
+        self._replica_strategy = "round_robin"
+        self._replica_counter = 0
+        self._loaders: Dict[Tuple[str, str], Loader] = {}
 
     def add_model(self, model: Model):
         self.models.append(model)
 
     async def create_tables(self):
-        async with self._pool.acquire() as connection:
+        """
+        Creates the tables, partitions and indexes missing, on every shard.
+        """
+        if self._shards and current_shard() is None:
+            for shard in range(len(self._shards)):
+                await on_shard(shard, self.create_tables)
+            return
+
+        async with self.acquire() as connection:
             for model in self.models:
-                await connection.execute(
-                    f"CREATE TABLE IF NOT EXISTS "
-                    f"{model.table_name} "
-                    f"({', '.join([f'{name} {type.get_db_type()}' for name, type in model.get_columns().items()])})"
+                await connection.execute(_table_sql(model))
+                partitioning = model.get_partitioning()
+                if partitioning is not None:
+                    for name, bound in partitioning.partitions():
+                        await connection.execute(partitioning.partition_sql(name, bound))
+
+            existing = {
+                row["indexname"]
+                for row in await connection.fetch(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = ANY($1)",
+                    [model.table_name for model in self.models],
                 )
+            }
+            for model in self.models:
+                for index in model.get_indexes():
+                    name = index.get_name()
+                    if name not in existing:
+                        await connection.execute(index.get_sql(name))
+
+    async def ensure_partitions(
+        self, ahead: int = None, today: datetime.date = None, drop: bool = True
+    ) -> Dict[str, List[str]]:
+        """
+        Maintains the range partitioned tables: creates the partitions up to ahead intervals
+        after today, and detaches the ones older than the retention. Run it periodically.
+        :param ahead: future partitions, the ahead of each RangePartition by default
+        :param today: the current date, date.today() by default
+        :param drop: drop the detached partitions, else keep them as plain tables
+        :return Dict[str, List[str]]: the created and removed partitions
+        """
+        today = today or datetime.date.today()
+        created = []
+        removed = []
+        if self._shards and current_shard() is None:
+            for shard in range(len(self._shards)):
+                result = await on_shard(shard, lambda: self.ensure_partitions(ahead, today, drop))
+                created.extend([name for name in result["created"] if name not in created])
+                removed.extend([name for name in result["removed"] if name not in removed])
+            return {"created": created, "removed": removed}
+
+        async with self.acquire() as connection:
+            for model in self.models:
+                partitioning = model.get_partitioning()
+                if not isinstance(partitioning, RangePartition):
+                    continue
+                existing = {
+                    row["relname"]
+                    for row in await connection.fetch(
+                        "SELECT child.relname FROM pg_inherits "
+                        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                        "WHERE parent.relname = $1",
+                        model.table_name,
+                    )
+                }
+                for start in partitioning.window(today, ahead):
+                    name = partitioning.name(start)
+                    if name not in existing:
+                        await connection.execute(partitioning.partition_sql(name, partitioning.bound(start)))
+                        created.append(name)
+
+                starts = [partitioning.parse(name) for name in existing]
+                expired = partitioning.expired(today, sorted([start for start in starts if start is not None]))
+                for start in expired:
+                    name = partitioning.name(start)
+                    await connection.execute(f"ALTER TABLE {model.table_name} DETACH PARTITION {name}")
+                    if drop:
+                        await connection.execute(f"DROP TABLE {name}")
+                    removed.append(name)
+                if expired:
+                    await self.invalidate(model.table_name, connection)
+        return {"created": created, "removed": removed}
+
+    async def bulk_save(self, instances: Iterable[Model], batch_size: int = 1000):
+        """
+        Saves many instances, inserting the new ones in batches per model.
+        :param instances: instances of any model
+        :param batch_size: max rows sent per COPY
+        """
+        new: Dict[Model, List[Model]] = {}
+        for instance in instances:
+            if instance._saved:
+                await instance.save()
+            else:
+                new.setdefault(instance._original_object, []).append(instance)
+
+        for model, group in new.items():
+            await model.insert_many(group, batch_size)
+
+    def session(self, batch_size: int = 1000) -> Session:
+        """
+        Opens a unit of work: inside it save() and delete() are deferred, fetched
+        instances are tracked, and every change is flushed in one transaction on exit.
+        :param batch_size: max rows per grouped statement
+        :return Session:
+        """
+        return Session(self, batch_size)
+
+    def transaction(
+        self, isolation: str = None, readonly: bool = False, deferrable: bool = False
+    ) -> Transaction:
+        """
+        Opens a transaction pinning one connection for every model operation inside it.
+        Nested transactions are savepoints.
+        :param isolation: read_committed, repeatable_read or serializable
+        :param readonly: READ ONLY transaction
+        :param deferrable: DEFERRABLE transaction, with serializable and readonly
+        :return Transaction:
+        """
+        return Transaction(self, isolation, readonly, deferrable)
+
+    def query_class(self, name: str) -> QueryClassScope:
+        """
+        Runs the queries of a block in an admission class, unless they set their own with ModelExecutor.query_class.
+        :return QueryClassScope: a context manager, sync or async
+        """
+        if self.admission is not None:
+            self.admission.get(name)
+        return QueryClassScope(name)
+
+    def query_timeout(self, query_class: str = None) -> Optional[float]:
+        """
+        Returns the default timeout of a query class, None without admission control.
+        """
+        if self.admission is None:
+            return None
+        return self.admission.get(query_class).timeout
+
+    def loaders(self, window: float = 0, max_batch: int = 1000) -> LoaderScope:
+        """
+        Opens a per-request scope for Model.load: instances are cached until the scope
+        ends and shared by its coroutines, they are never shared with other scopes.
+        :param window: seconds keys are collected before a batch is sent, 0 for the next event loop iteration
+        :param max_batch: max keys per query
+        :return LoaderScope:
+        """
+        return LoaderScope(self, window, max_batch)
+
+    def loader(self, model: Model, column: DatabaseType) -> Loader:
+        """
+        Returns the loader used outside of scopes: it coalesces concurrent loads,
+        but doesn't cache, and every caller gets its own instance.
+        """
+        key = (model.table_name, column.get_name())
+        loader = self._loaders.get(key)
+        if loader is None:
+            loader = self._loaders[key] = Loader(model, column)
+        return loader
+
+    def compile(self, key: Tuple, build: Callable[[ValuesManager], str]) -> str:
+        """
+        Returns the SQL text cached for a query shape, building it on a miss.
+        :param key: the query shape
+        :param build: renders the SQL text
+        :return str:
+        """
+        query = self._queries.get(key)
+        if query is None:
+            query = build(ValuesManager())
+            self._queries.set(key, query)
+        return query
+
+    def add_observer(self, observer: QueryObserver) -> QueryObserver:
+        """
+        Registers an observer notified before and after every query sent by the models.
+        :param observer: a QueryObserver, e.g. SlowQueryLogger or QueryStats
+        :return QueryObserver: the observer
+        """
+        self._observers.append(observer)
+        return observer
+
+    def remove_observer(self, observer: QueryObserver):
+        self._observers.remove(observer)
+
+    def before_query(self, callback: Callable[[QueryEvent], Any]) -> Callable[[QueryEvent], Any]:
+        """
+        Decorator registering a callback called with the QueryEvent before each query.
+        """
+        self.add_observer(CallbackObserver(before=callback))
+        return callback
+
+    def after_query(self, callback: Callable[[QueryEvent], Any]) -> Callable[[QueryEvent], Any]:
+        """
+        Decorator registering a callback called with the completed QueryEvent after each query.
+        """
+        self.add_observer(CallbackObserver(after=callback))
+        return callback
+
+    async def query(
+        self,
+        connection: Any,
+        method: str,
+        query: str,
+        values: Sequence[Any],
+        operation: str,
+        model: Model = None,
+        build_time: float = 0.0,
+        acquire_time: float = 0.0,
+        **kwargs,
+    ) -> Any:
+        """
+        Runs a query on a connection, notifying the observers with its timings.
+        :param connection: the connection to use
+        :param method: fetch, fetchrow, fetchval, execute or a copy method
+        :param query: the SQL text, or the table name for a COPY
+        :param values: the bound parameters
+        :param operation: the model operation, e.g. fetch or update
+        :param model: the queried model
+        :param build_time: seconds spent building the query
+        :param acquire_time: seconds spent waiting for the connection
+        :return Any: the connection method result
+        """
+        if not self._observers:
+            return await getattr(connection, method)(query, *values, **kwargs)
 
-    async def start(self, *conn_args, **conn_kwargs):
+        event = QueryEvent(operation, model, query, len(values), build_time, acquire_time)
+        for observer in self._observers:
+            observer.before_query(event)
+
+        started = perf_counter()
+        try:
+            result = await getattr(connection, method)(query, *values, **kwargs)
+        except BaseException as e:
+            event.error = e
+            raise
+        else:
+            event.rows = _rows(method, result)
+            return result
+        finally:
+            event.execution_time = perf_counter() - started
+            for observer in self._observers:
+                observer.after_query(event)
+
+    def notify(self, event: QueryEvent):
+        """
+        Sends an already timed event to the observers, for queries not run through query().
+        """
+        for observer in self._observers:
+            observer.before_query(event)
+        for observer in self._observers:
+            observer.after_query(event)
+
+    def pool_stats(self) -> Dict[str, int]:
+        """
+        Returns the connection pool size, idle connections and max size, also per replica and per shard.
+        """
+        if self._pool is None:
+            return {"size": 0, "idle": 0, "used": 0, "max": 0, "replicas": [], "shards": []}
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "size": size,
+            "idle": idle,
+            "used": size - idle,
+            "max": self._pool.get_max_size(),
+            "replicas": [replica.stats() for replica in self._replicas],
+            "shards": [
+                {"size": pool.get_size(), "idle": pool.get_idle_size(), "max": pool.get_max_size()}
+                for pool in self._shards
+            ],
+        }
+
+    async def invalidate(self, table: str, connection: Any = None):
+        """
+        Drops the cached results of a table after a write, and notifies the other
+        processes through the connection that wrote.
+        :param table: the written table
+        :param connection: the connection used for the write
+        """
+        if self.result_cache is None:
+            return
+
+        self.result_cache.invalidate(table)
+        transaction = Transaction.current(self)
+        if transaction is not None:
+            transaction.written(table)
+        if self.result_cache.channel and connection is not None:
+            await connection.execute("SELECT pg_notify($1, $2)", self.result_cache.channel, table)
+
+    def _on_invalidation(self, connection: Any, pid: int, channel: str, table: str):
+        self.result_cache.invalidate(table)
+
+    async def start(
+        self,
+        *conn_args,
+        replicas: Iterable[str] = (),
+        replica_strategy: str = "round_robin",
+        replica_retry: float = 5,
+        shards: Iterable[str] = (),
+        **conn_kwargs,
+    ):
+        """
+        Creates the connection pool of the primary, and one per read replica.
+        Reads outside transactions go to the replicas, writes to the primary.
+        json and jsonb values are decoded to Python objects, a custom init runs after.
+        :param replicas: DSNs of the read replicas, connected with the same pool options
+        :param replica_strategy: round_robin or least_busy
+        :param replica_retry: seconds a replica is skipped after a connection error
+        :param shards: DSNs of the shards, instead of a single DSN, see Model.shard_by
+        """
+        if replica_strategy not in ("round_robin", "least_busy"):
+            raise ValueError("replica_strategy must be round_robin or least_busy")
+        shards = list(shards)
+        if shards and (conn_args or "dsn" in conn_kwargs or replicas):
+            raise ValueError("shards replace the DSN, and can't be combined with replicas")
         self._conn_args = conn_args
-        self._conn_kwargs = conn_kwargs
-        self._pool = await asyncpg.create_pool(*self._conn_args, **self._conn_kwargs)
+        self._conn_kwargs = {**conn_kwargs, "init": _init_connection(conn_kwargs.get("init"))}
+        if shards:
+            self._shards = [await asyncpg.create_pool(dsn, **self._conn_kwargs) for dsn in shards]
+            # unsharded models live on the first shard
+            self._pool = self._shards[0]
+        else:
+            self._pool = await asyncpg.create_pool(*self._conn_args, **self._conn_kwargs)
+        if self.admission is not None and self.admission.capacity is None:
+            self.admission.capacity = self._pool.get_max_size()
+
+        # the DSN is the only option not shared with the replicas
+        self._pool_kwargs = {key: value for key, value in self._conn_kwargs.items() if key != "dsn"}
+        self._replica_strategy = replica_strategy
+        self._replicas = [Replica(dsn, replica_retry) for dsn in replicas]
+        for replica in self._replicas:
+            await replica.connect(**self._pool_kwargs)
+
+        if self.result_cache is not None and self.result_cache.channel:
+            # a connection of its own, held outside the pool the admission capacity is based on
+            options = {key: value for key, value in self._conn_kwargs.items() if key not in POOL_OPTIONS}
+            self._listener = await asyncpg.connect(*(shards[:1] or self._conn_args), **options)
+            await self._listener.add_listener(self.result_cache.channel, self._on_invalidation)
 
     async def stop(self):
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        for replica in self._replicas:
+            await replica.close()
+        # the first shard is the primary pool
+        for pool in self._shards[1:]:
+            await pool.close()
+        self._shards = []
         await self._pool.close()
 
-    def get_connection(self):
+    def acquire(self):
+        shard = current_shard()
+        if shard is not None and self._shards:
+            return self._shards[shard].acquire()
         return self._pool.acquire()
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self._shards)
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+
+    def shard_for(self, value: Any) -> int:
+        """
+        Returns the shard holding the rows whose shard key is value.
+        """
+        return shard_index(value, len(self._shards))
+
+    def on_shard(self, shard: int) -> ShardScope:
+        """
+        Runs the queries of a block on a shard, e.g. client.on_shard(client.shard_for(user_id)).
+        Transactions opened inside it run on that shard.
+        :return ShardScope: a context manager, sync or async
+        """
+        if not 0 <= shard < len(self._shards):
+            raise ValueError(f"Shard {shard} doesn't exist, the client has {len(self._shards)}")
+        return ShardScope(shard)
+
+    def get_connection(self, read: bool = False, using: str = None, query_class: str = None):
+        """
+        Returns a context manager giving the connection of the current transaction,
+        else one from a healthy replica for reads, else one from the primary.
+        Connections outside transactions wait for the admission of their query class.
+        :param read: the query only reads
+        :param using: "primary" or "replica", overrides the routing
+        :param query_class: admission class, the one of the current scope by default
+        """
+        transaction = Transaction.current(self)
+        if transaction is not None:
+            return PinnedConnection(transaction.connection)
+        if (read or using == "replica") and using != "primary" and self._replicas:
+            self._replica_counter += 1
+            replica = choose(self._replicas, self._replica_strategy, self._replica_counter)
+            if replica is not None:
+                return self.admit(ReplicaConnection(self, replica), query_class)
+        return self.admit(self.acquire(), query_class)
+
+    def admit(self, manager: Any, query_class: str = None) -> Any:
+        """
+        Wraps a connection context manager so it waits for the admission of its query class.
+        """
+        if self.admission is None:
+            return manager
+        return AdmittedConnection(self.admission, self.admission.get(query_class), manager)
+
+
+def _table_sql(model: Model) -> str:
+    partitioning = model.get_partitioning()
+    columns = [f"{name} {column.get_db_type(partitioning is None)}" for name, column in model.get_columns().items()]
+    if partitioning is not None:
+        # a partitioned table's primary key must contain the partition key
+        keys = [name for name, column in model.get_columns().items() if column.is_primary_key()]
+        if keys:
+            key = partitioning.column.get_name()
+            columns.append(f"PRIMARY KEY ({', '.join(keys if key in keys else [*keys, key])})")
+    return (
+        f"CREATE TABLE IF NOT EXISTS {model.table_name} "
+        f"({', '.join(columns)})"
+        f"{' ' + partitioning.get_sql() if partitioning is not None else ''}"
+    )
+
+
+def _init_connection(init: Callable[[Any], Any] = None) -> Callable[[Any], Any]:
+    async def initialize(connection: Any):
+        await register_json(connection)
+        if init is not None:
+            await init(connection)
+
+    return initialize
+
+
+def _rows(method: str, result: Any) -> int:
+    if method == "fetch":
+        return len(result)
+    if method in ("fetchrow", "fetchval"):
+        return int(result is not None)
+    if isinstance(result, str):
+        # command tag, e.g. UPDATE 3 or COPY 100
+        tag = result.rsplit(" ", 1)[-1]
+        return int(tag) if tag.isdigit() else 0
+    return 0
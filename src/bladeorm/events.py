@@ -0,0 +1,158 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Tuple, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    from .model import Model
+
+
+@dataclass
+class QueryEvent:
+    """
+    A statement sent by BladeORM, times are in seconds.
+    query is the parameterized SQL text, without literals, so it identifies the query shape.
+    """
+
+    operation: str
+    model: "Model"
+    query: str
+    parameters: int
+    build_time: float = 0.0
+    acquire_time: float = 0.0
+    execution_time: float = 0.0
+    rows: int = 0
+    error: BaseException = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def table_name(self) -> str:
+        return self.model.table_name if self.model is not None else None
+
+    @property
+    def total_time(self) -> float:
+        return self.build_time + self.acquire_time + self.execution_time
+
+
+class QueryObserver:
+    """
+    Receives every query sent through a Client, see Client.add_observer.
+    """
+
+    def before_query(self, event: QueryEvent):
+        pass
+
+    def after_query(self, event: QueryEvent):
+        pass
+
+
+class CallbackObserver(QueryObserver):
+    def __init__(
+        self,
+        before: Callable[[QueryEvent], Any] = None,
+        after: Callable[[QueryEvent], Any] = None,
+    ):
+        self._before = before
+        self._after = after
+
+    def before_query(self, event: QueryEvent):
+        if self._before:
+            self._before(event)
+
+    def after_query(self, event: QueryEvent):
+        if self._after:
+            self._after(event)
+
+
+class SlowQueryLogger(QueryObserver):
+    """
+    Logs the queries slower than threshold seconds, build, acquire and execution time included.
+    """
+
+    def __init__(self, threshold: float = 0.5, logger: logging.Logger = None):
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger("bladeorm.slow")
+
+    def after_query(self, event: QueryEvent):
+        if event.total_time >= self.threshold:
+            self.logger.warning(
+                "slow %s on %s: %.1fms (build %.1fms, acquire %.1fms, execution %.1fms, %d rows) %s",
+                event.operation,
+                event.table_name,
+                event.total_time * 1000,
+                event.build_time * 1000,
+                event.acquire_time * 1000,
+                event.execution_time * 1000,
+                event.rows,
+                event.query,
+            )
+
+
+class QueryStats(QueryObserver):
+    """
+    In-process statistics per query shape, percentiles are computed
+    over the last samples executions of each shape.
+    """
+
+    def __init__(self, samples: int = 1024):
+        self._samples = samples
+        self._shapes: Dict[Tuple[str, str], "_ShapeStats"] = {}
+
+    def after_query(self, event: QueryEvent):
+        key = (event.operation, event.query)
+        stats = self._shapes.get(key)
+        if stats is None:
+            stats = self._shapes[key] = _ShapeStats(self._samples)
+        stats.add(event)
+
+    def table(self) -> List[Dict[str, Any]]:
+        """
+        Returns one row per query shape, slowest total time first.
+        """
+        rows = [stats.row(operation, query) for (operation, query), stats in self._shapes.items()]
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows
+
+    def reset(self):
+        self._shapes.clear()
+
+
+class _ShapeStats:
+    def __init__(self, samples: int):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.build = 0.0
+        self.acquire = 0.0
+        self.times: Deque[float] = deque(maxlen=samples)
+
+    def add(self, event: QueryEvent):
+        self.count += 1
+        self.errors += event.error is not None
+        self.rows += event.rows
+        self.total += event.total_time
+        self.build += event.build_time
+        self.acquire += event.acquire_time
+        self.times.append(event.total_time)
+
+    def row(self, operation: str, query: str) -> Dict[str, Any]:
+        times = sorted(self.times)
+        return {
+            "operation": operation,
+            "query": query,
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total": self.total,
+            "mean": self.total / self.count,
+            "build": self.build / self.count,
+            "acquire": self.acquire / self.count,
+            "p50": _percentile(times, 0.50),
+            "p95": _percentile(times, 0.95),
+            "p99": _percentile(times, 0.99),
+        }
+
+
+def _percentile(times: List[float], percentile: float) -> float:
+    return times[min(len(times) - 1, int(len(times) * percentile))] if times else 0.0
@@ -0,0 +1,200 @@
+from contextvars import Context
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+from .utils import DatabaseType, Index, Operator
+from .jsoncodec import loads
+import asyncio
+import logging
+import random
+
+if TYPE_CHECKING:
+    from .model import Model
+
+
+EQUALITY_OPERATORS = ("=", "IN", "IS")
+RANGE_OPERATORS = ("<", "<=", ">", ">=")
+
+
+@dataclass
+class Plan:
+    """
+    A parsed EXPLAIN (FORMAT JSON) plan, times are in milliseconds.
+    Actual values are None unless the plan was explained with analyze.
+    """
+
+    plan: Dict[str, Any]
+    planning_time: float = None
+    execution_time: float = None
+
+    @staticmethod
+    def parse(result: Any) -> "Plan":
+        data = loads(result) if isinstance(result, (str, bytes)) else result
+        root = data[0]
+        return Plan(root["Plan"], root.get("Planning Time"), root.get("Execution Time"))
+
+    def nodes(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterates over the plan nodes, depth first.
+        """
+        stack = [self.plan]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.get("Plans", ())))
+
+    @property
+    def total_cost(self) -> float:
+        return self.plan["Total Cost"]
+
+    @property
+    def actual_time(self) -> Optional[float]:
+        return self.plan.get("Actual Total Time")
+
+    @property
+    def rows(self) -> int:
+        """
+        Rows returned, estimated unless analyzed.
+        """
+        return self.plan.get("Actual Rows", self.plan["Plan Rows"])
+
+    @property
+    def seq_scans(self) -> List[str]:
+        """
+        Tables read with a sequential scan.
+        """
+        return [node["Relation Name"] for node in self.nodes() if node["Node Type"] == "Seq Scan"]
+
+
+@dataclass
+class Advice:
+    """
+    A sequential scan on a large table found by the IndexAdvisor.
+    """
+
+    table: str
+    rows: int
+    query: str
+    plan: Plan
+    index: Optional[str] = None
+    count: int = field(default=1)
+
+
+def predicates(where: Operator, table: str) -> Tuple[List[DatabaseType], List[DatabaseType]]:
+    """
+    Returns the columns of table compared to a value in the AND-ed conditions of a WHERE tree,
+    with equality then with a range. OR and NOT branches are skipped, one index can't serve them.
+    """
+    # by name, == on a column builds an expression
+    equality: Dict[str, DatabaseType] = {}
+    ranges: Dict[str, DatabaseType] = {}
+    stack = [where]
+    while stack:
+        operator = stack.pop()
+        if not isinstance(operator, Operator) or isinstance(operator, DatabaseType):
+            continue
+        if operator.operator == "AND":
+            # right first, so columns come in the order of the WHERE
+            stack.extend([operator.second, operator.first])
+            continue
+        sides = [side for side in (operator.first, operator.second) if isinstance(side, DatabaseType)]
+        if len(sides) != 1 or sides[0].shape()[0] != table:
+            continue
+        if operator.operator in EQUALITY_OPERATORS:
+            equality.setdefault(sides[0].get_name(), sides[0])
+        elif operator.operator in RANGE_OPERATORS:
+            ranges.setdefault(sides[0].get_name(), sides[0])
+    return list(equality.values()), [column for name, column in ranges.items() if name not in equality]
+
+
+class IndexAdvisor:
+    """
+    Explains a sample of the query shapes run by a Client, and suggests an index for
+    the sequential scans on tables of at least min_rows rows, from the columns of the WHERE tree.
+    Each query shape is sampled at most once. EXPLAIN runs without ANALYZE, the query isn't executed again.
+    """
+
+    def __init__(self, rate: float = 0.01, min_rows: int = 10000, logger: logging.Logger = None):
+        """
+        :param rate: fraction of the new query shapes explained
+        :param min_rows: estimated rows making a table large
+        """
+        self.rate = rate
+        self.min_rows = min_rows
+        self.logger = logger or logging.getLogger("bladeorm.advisor")
+        self.advices: Dict[Tuple[str, Optional[str]], Advice] = {}
+        self._seen: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def observe(self, model: "Model", where: Optional[Operator], query: str, values: List[Any]):
+        """
+        Called after each query with its bound values, schedules its explain when sampled.
+        """
+        if query in self._seen:
+            return
+        self._seen.add(query)
+        if random.random() >= self.rate:
+            return
+        # a fresh context, the explain must not run in the caller's transaction
+        task = Context().run(asyncio.ensure_future, self._explain(model, where, query, values))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, model: "Model", where: Optional[Operator], query: str, values: List[Any]):
+        client = model.get_client()
+        try:
+            async with client.acquire() as connection:
+                plan = Plan.parse(await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *values))
+                tables = set(plan.seq_scans)
+                if not tables:
+                    return
+                sizes = dict(await connection.fetch(
+                    "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY($1)", list(tables)
+                ))
+                indexes = dict(await connection.fetch(
+                    "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = ANY($1)", list(tables)
+                ))
+        except Exception as e:
+            self.logger.debug("explain of %s failed: %r", query, e)
+            return
+
+        for table in tables:
+            rows = sizes.get(table, 0)
+            if rows < self.min_rows:
+                continue
+            index = self.suggest(table, where, indexes)
+            key = (table, index)
+            if key in self.advices:
+                self.advices[key].count += 1
+                continue
+            self.advices[key] = Advice(table, rows, query, plan, index)
+            self.logger.warning(
+                "sequential scan on %s (%d rows): %s%s", table, rows, query,
+                f", consider {index}" if index else "",
+            )
+
+    def suggest(self, table: str, where: Optional[Operator], indexes: Dict[str, str] = None) -> Optional[str]:
+        """
+        Returns a CREATE INDEX on the equality columns, then the first range column, of the WHERE tree.
+        :param indexes: existing index names to definitions, a suggestion they already cover is None
+        """
+        if where is None:
+            return None
+        equality, ranges = predicates(where, table)
+        columns = equality + ranges[:1]
+        if not columns:
+            return None
+        index = Index(*columns, concurrently=True).initialize(table)
+        name = index.get_name()
+        prefix = f"({', '.join([column.get_name() for column in columns])}"
+        if indexes and (
+            name in indexes
+            or any([prefix + ")" in definition or prefix + ", " in definition for definition in indexes.values()])
+        ):
+            return None
+        return index.get_sql(name)
+
+    def report(self) -> List[Advice]:
+        """
+        Returns the advices, most frequent first.
+        """
+        return sorted(self.advices.values(), key=lambda advice: advice.count, reverse=True)
@@ -0,0 +1,44 @@
+from typing import Any, Callable
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serializes to JSON bytes with orjson when installed, dates as ISO strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+loads: Callable[[bytes], Any] = orjson.loads if orjson is not None else json.loads
+
+
+async def register_json(connection: Any):
+    """
+    Sets the codecs of json and jsonb on a connection, values are sent and received
+    in binary format, without the intermediate str of the default text codecs.
+    """
+    await connection.set_type_codec(
+        "json", schema="pg_catalog", encoder=dumps, decoder=loads, format="binary"
+    )
+    # the binary jsonb format is a version byte followed by the JSON text
+    await connection.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=lambda value: b"\x01" + dumps(value),
+        decoder=lambda data: loads(data[1:]),
+        format="binary",
+    )
@@ -0,0 +1,149 @@
+from contextvars import Context, ContextVar
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple, TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+    from .client import Client
+    from .model import Model
+    from .utils import DatabaseType
+
+
+_current_scope: ContextVar[Optional["LoaderScope"]] = ContextVar("bladeorm_loader_scope", default=None)
+
+
+class Loader:
+    """
+    Collects the keys requested by concurrent coroutines and loads them with one
+    SELECT * ... WHERE column = ANY($1) query per batch.
+    A batch is sent on the next event loop iteration, or after window seconds,
+    outside of any transaction.
+    """
+
+    def __init__(
+        self,
+        model: "Model",
+        column: "DatabaseType",
+        window: float = 0,
+        max_batch: int = 1000,
+        shared: bool = False,
+    ):
+        """
+        :param shared: cache the instances and hand the same one to every caller, else each caller gets its own
+        """
+        self._model = model
+        self._column = column
+        self._window = window
+        self._max_batch = max_batch
+        self._cache: Optional[Dict[Hashable, Any]] = {} if shared else None
+
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._handle = None
+        # running batches, referenced until they end
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if key is None:
+            future.set_result(None)
+            return future
+        if self._cache is not None and key in self._cache:
+            future.set_result(self._cache[key])
+            return future
+
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self._max_batch:
+            self._dispatch()
+        elif self._handle is None:
+            self._handle = (
+                loop.call_later(self._window, self._dispatch) if self._window else loop.call_soon(self._dispatch)
+            )
+        return future
+
+    def _dispatch(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            # a fresh context, the batch must not run in the transaction of the coroutine that filled it
+            task = Context().run(asyncio.ensure_future, self._load(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, pending: Dict[Hashable, List[asyncio.Future]]):
+        try:
+            rows = await self._model._fetch_any_rows(self._column, list(pending), "load")
+        except BaseException as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        name = self._column.get_name()
+        by_key = {row[name]: row for row in rows}
+        for key, futures in pending.items():
+            row = by_key.get(key)
+            instance = self._model.from_record(row) if row is not None else None
+            if self._cache is not None:
+                self._cache[key] = instance
+            for future in futures:
+                if not future.done():
+                    future.set_result(instance)
+                    # without a scope, every caller can mutate its own instance
+                    if self._cache is None and row is not None:
+                        instance = self._model.from_record(row)
+
+    def clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+
+class LoaderScope:
+    """
+    Per-request loaders: instances are cached for the scope and shared by its coroutines.
+    """
+
+    def __init__(self, client: "Client", window: float = 0, max_batch: int = 1000):
+        self._client = client
+        self._window = window
+        self._max_batch = max_batch
+        self._loaders: Dict[Tuple[str, str], Loader] = {}
+        self._token = None
+
+    @staticmethod
+    def current(client: "Client") -> Optional["LoaderScope"]:
+        scope = _current_scope.get()
+        return scope if scope is not None and scope._client is client else None
+
+    def loader(self, model: "Model", column: "DatabaseType") -> Loader:
+        key = (model.table_name, column.get_name())
+        loader = self._loaders.get(key)
+        if loader is None:
+            loader = self._loaders[key] = Loader(model, column, self._window, self._max_batch, shared=True)
+        return loader
+
+    async def __aenter__(self) -> "LoaderScope":
+        self._token = _current_scope.set(self)
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        _current_scope.reset(self._token)
+        self._loaders = {}
+
+
+def get_loader(model: "Model", column: "DatabaseType") -> Loader:
+    """
+    Returns the loader of the current scope, else the client's loader, which doesn't cache.
+    """
+    client = model.get_client()
+    scope = LoaderScope.current(client)
+    if scope is not None:
+        return scope.loader(model, column)
+    return client.loader(model, column)
+
+
+async def load_many(model: "Model", keys: List[Hashable], column: "DatabaseType") -> List[Optional["Model"]]:
+    loader = get_loader(model, column)
+    return list(await asyncio.gather(*[loader.load(key) for key in keys]))
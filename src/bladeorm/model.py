@@ -1,9 +1,12 @@
-from .utils import DatabaseType
+from .utils import DatabaseType, Operator, Index, Reference
 from .query import ModelExecutor
-from typing import Dict, Any, Union, TYPE_CHECKING, List
+from .session import Session
+from .loader import get_loader, load_many
+from .jsoncodec import dumps
+from .partition import Partitioning
+from typing import Dict, Any, Union, TYPE_CHECKING, List, Iterable, Optional
 from dataclasses import dataclass, fields, MISSING
 from typing import Callable
-import json
 import datetime
 
 if TYPE_CHECKING:
@@ -18,10 +21,30 @@ Int = DatabaseType(int, "INTEGER")
 BigInt = DatabaseType(int, "BIGINT")
 Float = DatabaseType(float, "DOUBLE PRECISION")
 Bool = DatabaseType(bool, "BOOLEAN")
-SmallSerial = DatabaseType(int, "SMALLSERIAL", True)
-Serial = DatabaseType(int, "SERIAL", True)
-BigSerial = DatabaseType(int, "BIGSERIAL", True)
+SmallSerial = DatabaseType(int, "SMALLSERIAL", True, sql_type="SMALLINT")
+Serial = DatabaseType(int, "SERIAL", True, sql_type="INTEGER")
+BigSerial = DatabaseType(int, "BIGSERIAL", True, sql_type="BIGINT")
 Date = DatabaseType(datetime.date, "DATE")
+Json = DatabaseType(object, "JSON")
+Jsonb = DatabaseType(object, "JSONB")
+
+
+def ForeignKey(
+    model: "Model", on_delete: str = None, related_name: str = None, reverse_name: str = None
+) -> DatabaseType:
+    """
+    Column holding the id of another model, emitted as REFERENCES.
+    :param model: the referenced model, it must have an id column
+    :param on_delete: CASCADE, SET NULL, SET DEFAULT, RESTRICT or NO ACTION
+    :param related_name: attribute of the referenced instance, defaults to the column name without _id
+    :param reverse_name: attribute of the referencing instances on the referenced model, defaults to the table name
+    :return DatabaseType:
+    """
+    model._id_check()
+    id_column = model._id
+    column = DatabaseType(id_column._expected_type, id_column.get_sql_type())
+    column._reference = Reference(model, on_delete, related_name, reverse_name)
+    return column
 
 
 class Model(ModelExecutor):
@@ -29,8 +52,21 @@ class Model(ModelExecutor):
     This class wraps models and models instances.
     """
 
+    # no __dict__ in the bases of the Record classes
+    __slots__ = ()
+
     _client = None
     _table_name = None
+    _record_class = None
+    # instances fetched together with deferred columns, see load_deferred
+    _deferred = None
+    # related instances attached by select_related and prefetch_related
+    _related = None
+    _relations: Dict[str, DatabaseType] = {}
+    # PARTITION BY of the table, see partition_by
+    _partitioning: Partitioning = None
+    # column routing the rows to a shard, see shard_by
+    _shard_key: DatabaseType = None
 
     def __init__(
         self,
@@ -57,7 +93,7 @@ class Model(ModelExecutor):
         if self._values and self._id:
             self._update_original_id()
 
-        if not self._id:
+        if not self._id and not self._original_object:
             for name, column in self._columns.items():
                 if column.id_status:
                     if not self._id:
@@ -68,11 +104,21 @@ class Model(ModelExecutor):
     def __getattr__(self, item):
         if not self._values:
             return self._columns[item]
-        else:
+        try:
             return self._values[item]
+        except KeyError:
+            return self._get_related(item)
+
+    def _get_related(self, item):
+        related = self._related
+        if related is not None and item in related:
+            return related[item]
+        if item in self._relations:
+            raise AttributeError(f"{item} is not loaded, use select_related or prefetch_related") from None
+        raise KeyError(item)
 
     def _update_original_id(self):
-        self._original_id = self._values.get(self._id.get_name())
+        self._original_id = self.get_values().get(self._id.get_name())
 
     def _id_check(self):
         if not self._id:
@@ -83,6 +129,14 @@ class Model(ModelExecutor):
             self._columns[key].check_value(value)
         return self.__class__(self._columns, self._id, self, values, saved)
 
+    def from_record(self, record: Any) -> "Model":
+        """
+        Creates a saved instance wrapping a fetched row, without validating it.
+        :param record: an asyncpg Record
+        :return Model:
+        """
+        return self._record_class.from_record(record)
+
     def __call__(self, *args, **kwargs):
         if len(args) > 0:
             return self.filter(*args, **kwargs)
@@ -99,14 +153,16 @@ class Model(ModelExecutor):
         if not self._original_object:
             return await super().delete()
 
+        session = Session.current(self._client)
+        if session:
+            return session.delete(self)
+
         if not self._saved:
             raise ValueError(f"{self.__class__.__name__} not inserted")
 
         self._id_check()
 
-        result = await self._original_object.filter(
-            self._id == self._original_id
-        ).delete()
+        result = await self._original_object.filter(self._row_where()).delete()
         self._saved = False
         return result
     
@@ -116,44 +172,252 @@ class Model(ModelExecutor):
         
         self._id_check()
 
-        return await self._original_object.filter(self._id == self._original_id)
+        return await self._original_object.filter(self._row_where())
 
     async def save(self):
+        session = Session.current(self._client)
+        if session:
+            return session.add(self)
+
         if not self._saved:
             result = await self._original_object.insert(self)
-            self._saved = True
+            self._mark_saved()
             return result
 
         self._id_check()
 
         if self._updated_columns:
-            result = await self._original_object.filter(
-                self._id == self._original_id
-            ).update(
+            rows = await self._original_object.filter(self._row_where()).update(
+                returning=True,
                 **{
                     k: v
                     for k, v in self._values.items()
                     if self._updated_columns.get(k)
                 }
             )
+            if rows:
+                self._values.update(rows[0].get_values())
             self._updated_columns = {}
             self._update_original_id()
-            return result
+            return len(rows)
+
+    async def insert_many(
+        self,
+        rows: Iterable[Union["Model", Dict[str, Any]]],
+        batch_size: int = 1000,
+    ) -> List["Model"]:
+        """
+        Inserts many rows at once.
+        :param rows: instances or dicts of column values
+        :param batch_size: max rows sent per COPY
+        :return List[Model]: the inserted instances, those with an id left to a SQL default stay unsaved
+        """
+        instances = self._to_instances(rows)
+        for instance in instances:
+            if instance._saved:
+                raise ValueError(f"{self.__class__.__name__} already inserted")
+
+        await super().insert_many(instances, batch_size)
+
+        for instance in instances:
+            instance._mark_written()
+        return instances
+
+    async def upsert(
+        self, conflict: Union[DatabaseType, Iterable[DatabaseType]], update: Iterable[DatabaseType] = None
+    ):
+        """
+        Inserts the instance, or updates the row conflicting with it, and reads the row back.
+        :param conflict: column(s) of the unique constraint
+        :param update: columns to overwrite on conflict, all the others by default, empty for DO NOTHING
+        """
+        if not self._original_object:
+            raise TypeError(f"Model {self.__class__.__name__} is not an instance")
+
+        result = await self._original_object.upsert_rows([self], conflict, update, returning=True)
+        self._mark_written()
+        return result
+
+    async def upsert_many(
+        self,
+        rows: Iterable[Union["Model", Dict[str, Any]]],
+        conflict: Union[DatabaseType, Iterable[DatabaseType]],
+        update: Iterable[DatabaseType] = None,
+        batch_size: int = 1000,
+    ) -> List["Model"]:
+        """
+        Inserts many rows at once with INSERT ... ON CONFLICT.
+        :param rows: instances or dicts of column values
+        :param conflict: column(s) of the unique constraint
+        :param update: columns to overwrite on conflict, all the others by default, empty for DO NOTHING
+        :param batch_size: max rows per statement
+        :return List[Model]: the instances, with the upserted rows read back
+        """
+        instances = self._to_instances(rows)
+        await self.upsert_rows(instances, conflict, update, batch_size, returning=True)
+
+        for instance in instances:
+            instance._mark_written()
+        return instances
+
+    async def load_deferred(self, *columns: DatabaseType):
+        """
+        Loads the columns deferred by only() or defer(), for this instance and every
+        instance fetched with it that still lacks them, in one query.
+        :param columns: columns to load, all the deferred ones by default
+        """
+        if not self._original_object:
+            raise TypeError(f"Model {self.__class__.__name__} is not an instance")
+
+        names = [column.get_name() for column in columns] if columns else list(self._columns)
+        instances = self._deferred or [self]
+        missing = tuple([
+            name for name in names if any([not instance.is_loaded(name) for instance in instances])
+        ])
+        if missing:
+            await self._original_object._load_deferred(instances, missing)
+
+    def is_loaded(self, column: Union[str, DatabaseType]) -> bool:
+        """
+        Returns False if the column was deferred and not loaded yet.
+        """
+        name = column if isinstance(column, str) else column.get_name()
+        return name in self.get_values()
+
+    async def load(self, key: Any, by: DatabaseType = None) -> Optional["Model"]:
+        """
+        Loads an instance by id, or by another unique column. Concurrent loads of the same
+        event loop iteration are sent as one SELECT * ... WHERE column = ANY($1).
+        Inside client.loaders() instances are cached and shared for the scope.
+        :param key: the id, or the value of by
+        :param by: unique column to look up, the id column by default
+        :return Optional[Model]: None if no row matches
+        """
+        return await get_loader(self, self._load_column(by)).load(key)
+
+    async def load_many(self, keys: Iterable[Any], by: DatabaseType = None) -> List[Optional["Model"]]:
+        """
+        Loads many instances like load, in the order of keys.
+        :return List[Optional[Model]]: None for the keys without a row
+        """
+        return await load_many(self, list(keys), self._load_column(by))
+
+    def _load_column(self, by: DatabaseType = None) -> DatabaseType:
+        if self._original_object:
+            raise TypeError("load is called on the model, not on an instance")
+        if by is None:
+            self._id_check()
+            return self._id
+        return by
+
+    def _to_instances(self, rows: Iterable[Union["Model", Dict[str, Any]]]) -> List["Model"]:
+        instances = []
+        for row in rows:
+            if isinstance(row, Model):
+                for key, value in row.get_values().items():
+                    self._columns[key].check_value(value)
+                instances.append(row)
+            else:
+                instances.append(self(**row))
+        return instances
+
+    def _mark_saved(self):
+        self._saved = True
+        self._updated_columns = {}
+        if self._id:
+            self._update_original_id()
+
+    def _mark_written(self):
+        # rows skipped by DO NOTHING or with an id left to a SQL default have no known id, they stay unsaved
+        if not self._id or self.get_values().get(self._id.get_name()) is not None:
+            self._mark_saved()
 
     def __setattr__(self, key, value):
         if key.startswith("_") or key not in self._columns:
-            self.__dict__[key] = value
+            object.__setattr__(self, key, value)
             return
 
-        if not self._values:
+        values = self.get_values()
+        if not values:
             raise TypeError(f"Model {self.__class__.__name__} is not an instance")
 
-        self._values[key] = value
+        values[key] = value
         self._updated_columns[key] = True
 
     def get_columns(self):
         return self._columns
 
+    def add_index(
+        self,
+        *columns: Operator,
+        using: str = None,
+        where: Operator = None,
+        unique: bool = False,
+        name: str = None,
+        concurrently: bool = False,
+    ) -> Index:
+        """
+        Declares an index, created by Client.create_tables if it doesn't exist.
+        :param columns: columns or expressions, more than one for a composite index
+        :param using: index method, e.g. btree, hash, gin, gist, brin
+        :param where: condition of a partial index
+        :param unique: UNIQUE index
+        :param name: defaults to a name derived from the table and columns
+        :param concurrently: create it without locking writes
+        :return Index:
+        """
+        index = Index(
+            *columns, using=using, where=where, unique=unique, name=name, concurrently=concurrently
+        ).initialize(self.table_name)
+        self._indexes.append(index)
+        return index
+
+    def get_indexes(self) -> List[Index]:
+        return self._indexes
+
+    def partition_by(self, partitioning: Partitioning) -> Partitioning:
+        """
+        Declares the partitioning of the table, created by Client.create_tables with its partitions.
+        The primary key becomes (id, partition key), PostgreSQL requires it to contain the partition key.
+        :param partitioning: RangePartition, ListPartition or HashPartition of a column of the model
+        :return Partitioning:
+        """
+        if partitioning.column.get_name() not in self._columns or partitioning.column.shape()[0] != self.table_name:
+            raise TypeError(f"{partitioning.column.get_name()} is not a column of {self.table_name}")
+        self._partitioning = partitioning.initialize(self.table_name)
+        return self._partitioning
+
+    def get_partitioning(self) -> Optional[Partitioning]:
+        return self._partitioning
+
+    def shard_by(self, column: DatabaseType):
+        """
+        Spreads the rows over the shards of the client by the hash of column.
+        Queries with an equality on it run on one shard, the others on every shard.
+        :param column: a column of the model, set on insert and never updated
+        """
+        if column.get_name() not in self._columns or column.shape()[0] != self.table_name:
+            raise TypeError(f"{column.get_name()} is not a column of {self.table_name}")
+        if column._database_type.endswith("SERIAL"):
+            # drawn by the shard the row is inserted in, it's unknown when routing
+            raise TypeError(f"{column.get_name()} is a serial column, it can't be the shard key")
+        self._shard_key = column
+
+    def get_shard_key(self) -> Optional[DatabaseType]:
+        return self._shard_key
+
+    def _row_where(self) -> Operator:
+        """
+        The condition matching the row of the instance, with its shard key when sharded.
+        """
+        where = self._id == self._original_id
+        key = self._original_object._shard_key
+        if key is not None:
+            if (self._updated_columns or {}).get(key.get_name()):
+                raise ValueError(f"{key.get_name()} is the shard key, it can't be updated")
+            where = where & (key == self.get_values()[key.get_name()])
+        return where
+
     def get_client(self):
         return self._client
 
@@ -161,10 +425,10 @@ class Model(ModelExecutor):
         return self._values
 
     def get_json(self):
-        return json.dumps(self._values)
+        return dumps(self.get_values()).decode()
 
     def __repr__(self):
-        return f"<{self.__class__.__name__} {self._values}>"
+        return f"<{self.__class__.__name__} {self.get_values()}>"
 
     def __str__(self):
         return self.__repr__()
@@ -174,6 +438,62 @@ class Model(ModelExecutor):
         return self._table_name
 
 
+class ModelRecord(Model):
+    """
+    Instance of a row fetched from the database, wrapping the asyncpg Record.
+    Values are copied into a dict only when the instance is mutated.
+    """
+
+    __slots__ = ("_record", "_values", "_updated_columns", "_original_id", "_saved", "_deferred", "_related")
+
+    _id_name: str = None
+
+    @classmethod
+    def from_record(cls, record: Any) -> "ModelRecord":
+        instance = cls.__new__(cls)
+        _set_record(instance, record)
+        _set_values(instance, None)
+        _set_updated_columns(instance, None)
+        _set_original_id(instance, record[cls._id_name] if cls._id_name else None)
+        _set_saved(instance, True)
+        _set_deferred(instance, None)
+        _set_related(instance, None)
+        return instance
+
+    def __getattr__(self, item):
+        if item.startswith("__"):
+            # no column lookup for probes like __dict__ or __getstate__
+            raise AttributeError(item)
+        values = self._values
+        try:
+            if values is None:
+                return self._record[item]
+            return values[item]
+        except KeyError:
+            if item in self._columns:
+                raise AttributeError(f"{item} is deferred, load it with load_deferred()") from None
+            return self._get_related(item)
+
+    def is_loaded(self, column: Union[str, DatabaseType]) -> bool:
+        name = column if isinstance(column, str) else column.get_name()
+        return name in (self._record if self._values is None else self._values)
+
+    def get_values(self):
+        if self._values is None:
+            self._values = dict(self._record)
+            self._updated_columns = {}
+        return self._values
+
+
+_set_record = ModelRecord._record.__set__
+_set_values = ModelRecord._values.__set__
+_set_updated_columns = ModelRecord._updated_columns.__set__
+_set_original_id = ModelRecord._original_id.__set__
+_set_saved = ModelRecord._saved.__set__
+_set_deferred = ModelRecord._deferred.__set__
+_set_related = ModelRecord._related.__set__
+
+
 def wrap_model(client: "Client") -> Callable[[Any], Model]:
     def model(model_class: Any) -> Model:
         """
@@ -193,14 +513,45 @@ def wrap_model(client: "Client") -> Callable[[Any], Model]:
                 )
                 columns[field.name] = field.type
 
-        class ModelWrapper(Model):
+        class ModelBase(Model):
+            # shared with Record, which stays without a __dict__
+            __slots__ = ()
             _client = client
             _table_name = table_name
+            _relations = {}
+
+        class ModelWrapper(ModelBase):
+            pass
 
         ModelWrapper.__name__ = model_class.__name__
         ModelWrapper.__qualname__ = model_class.__qualname__
 
         result = ModelWrapper(columns)
+        for column in columns.values():
+            reference = column.get_reference()
+            if reference:
+                reference.source = result
+                ModelWrapper._relations[reference.related_name] = column
+                reference.model._relations[reference.reverse_name] = column
+        result._indexes = [
+            column.get_index().initialize(table_name, column)
+            for column in columns.values()
+            if column.get_index()
+        ]
+
+        class Record(ModelRecord, ModelBase):
+            __slots__ = ()
+
+        # set after creation, ABCMeta would probe the model for abstract methods
+        Record._columns = columns
+        Record._id = result._id
+        Record._id_name = result._id.get_name() if result._id else None
+        Record._original_object = result
+        Record._model = result
+        Record.__name__ = model_class.__name__
+        Record.__qualname__ = model_class.__qualname__
+        ModelBase._record_class = Record
+
         client.add_model(result)
         return result
 
@@ -0,0 +1,180 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .utils import DatabaseType, literal
+import datetime
+import re
+
+
+INTERVAL_UNITS = {"day": "day", "days": "day", "week": "week", "weeks": "week", "month": "month",
+                  "months": "month", "year": "year", "years": "year"}
+
+
+class Partitioning:
+    """
+    Declarative partitioning of a table, see Model.partition_by.
+    """
+
+    method = ""
+
+    def __init__(self, column: DatabaseType, default: bool = False):
+        """
+        :param column: partition key
+        :param default: add a DEFAULT partition catching the rows matching no other partition
+        """
+        self.column = column
+        self.default = default
+        self.table: str = None
+
+    def initialize(self, table: str) -> "Partitioning":
+        self.table = table
+        return self
+
+    def get_sql(self) -> str:
+        return f"PARTITION BY {self.method} ({self.column.get_name()})"
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        """
+        Returns (name, FOR VALUES ... bound) of the partitions created with the table.
+        """
+        return [(f"{self.table}_default", "DEFAULT")] if self.default else []
+
+    def partition_sql(self, name: str, bound: str) -> str:
+        return f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {self.table} {bound}"
+
+
+class RangePartition(Partitioning):
+    """
+    One partition per interval of a Date column, e.g. RangePartition(Event.day, interval="1 month").
+    Client.ensure_partitions creates the future ones and drops the expired ones.
+    """
+
+    method = "RANGE"
+
+    def __init__(
+        self,
+        column: DatabaseType,
+        interval: str = "1 month",
+        start: datetime.date = None,
+        ahead: int = 3,
+        retention: int = None,
+        default: bool = False,
+    ):
+        """
+        :param interval: N day(s), week(s), month(s) or year(s)
+        :param start: first partition created by create_tables, the current one by default
+        :param ahead: future partitions kept ready
+        :param retention: past partitions kept besides the current one, None to keep them all
+        """
+        if column._expected_type is not datetime.date:
+            raise TypeError("RangePartition takes a Date column")
+        match = re.fullmatch(r"\s*(\d+)\s+([a-z]+)\s*", interval)
+        if not match or match.group(2) not in INTERVAL_UNITS or int(match.group(1)) < 1:
+            raise ValueError(f"Invalid interval {interval}, expected e.g. 1 month or 7 days")
+        super().__init__(column, default)
+        self.count = int(match.group(1))
+        self.unit = INTERVAL_UNITS[match.group(2)]
+        self.start = start
+        self.ahead = ahead
+        self.retention = retention
+
+    def floor(self, day: datetime.date) -> datetime.date:
+        """
+        Returns the start of the interval containing day.
+        """
+        if self.unit == "year":
+            return datetime.date(day.year - day.year % self.count, 1, 1)
+        if self.unit == "month":
+            months = day.year * 12 + day.month - 1
+            months -= months % self.count
+            return datetime.date(months // 12, months % 12 + 1, 1)
+        days = self.count * (7 if self.unit == "week" else 1)
+        # ordinal 1 is a Monday, weeks start on Mondays
+        ordinal = day.toordinal() - 1
+        return datetime.date.fromordinal(ordinal - ordinal % days + 1)
+
+    def shift(self, day: datetime.date, intervals: int) -> datetime.date:
+        """
+        Moves the start of an interval by a number of intervals.
+        """
+        if self.unit in ("year", "month"):
+            months = day.year * 12 + day.month - 1 + intervals * self.count * (12 if self.unit == "year" else 1)
+            return datetime.date(months // 12, months % 12 + 1, 1)
+        return day + datetime.timedelta(days=intervals * self.count * (7 if self.unit == "week" else 1))
+
+    def name(self, start: datetime.date) -> str:
+        return f"{self.table}_p{start:%Y%m%d}"
+
+    def bound(self, start: datetime.date) -> str:
+        return f"FOR VALUES FROM ({literal(start)}) TO ({literal(self.shift(start, 1))})"
+
+    def window(self, today: datetime.date, ahead: int = None, start: datetime.date = None) -> List[datetime.date]:
+        """
+        Returns the starts of the partitions from start, the current one by default, to ahead intervals after today.
+        """
+        current = self.floor(today)
+        first = self.floor(start) if start else current
+        last = self.shift(current, self.ahead if ahead is None else ahead)
+        starts = []
+        while first <= last:
+            starts.append(first)
+            first = self.shift(first, 1)
+        return starts
+
+    def expired(self, today: datetime.date, starts: Iterable[datetime.date]) -> List[datetime.date]:
+        """
+        Returns the partition starts older than the retention.
+        """
+        if self.retention is None:
+            return []
+        oldest = self.shift(self.floor(today), -self.retention)
+        return [start for start in starts if start < oldest]
+
+    def parse(self, name: str) -> Optional[datetime.date]:
+        match = re.fullmatch(rf"{re.escape(self.table)}_p(\d{{8}})", name)
+        return datetime.datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+    def partitions(self, today: datetime.date = None) -> List[Tuple[str, str]]:
+        return [
+            (self.name(start), self.bound(start))
+            for start in self.window(today or datetime.date.today(), start=self.start)
+        ] + super().partitions()
+
+
+class ListPartition(Partitioning):
+    """
+    One partition per named list of values, e.g. ListPartition(User.country, {"eu": ["fr", "de"], "us": ["us"]}).
+    """
+
+    method = "LIST"
+
+    def __init__(self, column: DatabaseType, values: Dict[str, Iterable[Any]], default: bool = False):
+        """
+        :param values: partition suffix to the values it holds
+        """
+        super().__init__(column, default)
+        self.values = {suffix: list(items) for suffix, items in values.items()}
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        return [
+            (f"{self.table}_{suffix}", f"FOR VALUES IN ({', '.join([literal(value) for value in items])})")
+            for suffix, items in self.values.items()
+        ] + super().partitions()
+
+
+class HashPartition(Partitioning):
+    """
+    modulus partitions spreading the rows by the hash of the column, e.g. HashPartition(Event.user_id, 8).
+    """
+
+    method = "HASH"
+
+    def __init__(self, column: DatabaseType, modulus: int):
+        if modulus < 1:
+            raise ValueError("modulus must be at least 1")
+        super().__init__(column)
+        self.modulus = modulus
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        return [
+            (f"{self.table}_h{remainder}", f"FOR VALUES WITH (MODULUS {self.modulus}, REMAINDER {remainder})")
+            for remainder in range(self.modulus)
+        ]
@@ -1,7 +1,19 @@
 from attr import attr
-from .utils import Operator, ValuesManager
+from .utils import Operator, ValuesManager, DatabaseType, Order, Alias, Function, Count, Sum, Avg, Min, Max, shape, bind
+from .session import Session, MAX_PARAMETERS
+from .transaction import Transaction
+from .cache import MISSING
+from .events import QueryEvent
+from .explain import Plan
+from .shard import current_shard, on_shard, iterate_on_shard, merge, shard_values
+from .replica import DISCONNECT_ERRORS
 from abc import ABC, abstractmethod
-from typing import Dict, Union, Any, TYPE_CHECKING, List
+from typing import Dict, Union, Any, TYPE_CHECKING, List, Tuple, Callable, AsyncIterator, Optional, Iterable, Awaitable
+from time import perf_counter
+import asyncio
+import base64
+import datetime
+import json
 
 if TYPE_CHECKING:
     from .model import Model
@@ -33,13 +45,87 @@ class PartialModel:
         for value in self._data_values:
             yield value
 
+
+COPY_FORMATS = ("csv", "text", "binary")
+
+
+def results_shape(results: Tuple[Union[Operator, Any], ...]) -> Tuple:
+    if not results:
+        return ()
+    return tuple([
+        result.shape() if isinstance(result, Operator) else result
+        for result in results
+    ])
+
+
+def affected(status: str) -> int:
+    """
+    Rows affected by a command, from its tag, e.g. UPDATE 3.
+    """
+    return int(status.rsplit(" ", 1)[-1])
+
+
+def encode_cursor(values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps([value.isoformat() if isinstance(value, datetime.date) else value for value in values]).encode()
+    ).decode()
+
+
+def decode_cursor(token: str, order: Tuple[Order, ...]) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise ValueError("Invalid pagination token") from None
+    if not isinstance(values, list) or len(values) != len(order):
+        raise ValueError("Invalid pagination token")
+    return [
+        datetime.date.fromisoformat(value) if item.expression._expected_type is datetime.date and value is not None else value
+        for value, item in zip(values, order)
+    ]
+
+
+# NumPy dtypes of the Python types of the columns, others are stored as objects
+DTYPES = {int: "int64", float: "float64", bool: "bool", datetime.date: "datetime64[D]"}
+
+
+def column_dtype(column: DatabaseType) -> str:
+    if column.get_sql_type().endswith("]"):
+        return "object"
+    return DTYPES.get(column._expected_type, "object")
+
+
+def _null_fill(dtype: str) -> Any:
+    """
+    Placeholder of the masked NULLs.
+    """
+    if dtype in ("int64", "float64"):
+        return 0
+    if dtype == "bool":
+        return False
+    if dtype == "datetime64[D]":
+        return "NaT"
+    return None
+
+
+def _attach(instance: "Model", name: str, related: Any):
+    if instance._related is None:
+        instance._related = {}
+    instance._related[name] = related
+
+
 class QueryExecutor(ABC):
+    __slots__ = ()
+
     @abstractmethod
     async def fetch(
         self, *results: Union[Operator, Any], limit: int = None, offset: int = None
     ) -> List["Model"]:
         pass
 
+    @abstractmethod
+    async def paginate(self, after: str = None, size: int = 50) -> Tuple[List["Model"], Optional[str]]:
+        pass
+
     @abstractmethod
     async def fetchone(self, *results: Union[Operator, Any]) -> "Model":
         pass
@@ -54,12 +140,225 @@ class QueryExecutor(ABC):
 
 
 class ModelExecutor(QueryExecutor):
-    def __init__(self, model: "Model", where: Operator = None):
+    # no __dict__ in the bases of the Record classes, ModelQuery holds the state of built queries
+    __slots__ = ()
+
+    _where: Operator = None
+    _order: Tuple[Order, ...] = ()
+    _group: Tuple[Operator, ...] = ()
+    # columns loaded into full models, None for all of them
+    _selected: Tuple[str, ...] = None
+    # foreign keys joined by select_related and loaded by prefetch_related
+    _joined: Tuple[DatabaseType, ...] = ()
+    _prefetched: Tuple[DatabaseType, ...] = ()
+    # "primary" or "replica" overriding the routing of reads, None to route automatically
+    _using: str = None
+    # admission class and timeout in seconds, None for the ones of the client
+    _query_class: str = None
+    _timeout: float = None
+
+    def __init__(
+        self,
+        model: "Model",
+        where: Operator = None,
+        order: Tuple[Order, ...] = (),
+        group: Tuple[Operator, ...] = (),
+        selected: Tuple[str, ...] = None,
+        joined: Tuple[DatabaseType, ...] = (),
+        prefetched: Tuple[DatabaseType, ...] = (),
+        using: str = None,
+        query_class: str = None,
+        timeout: float = None,
+    ):
         self._model = model
         self._where = where
+        self._order = order
+        self._group = group
+        self._selected = selected
+        self._joined = joined
+        self._prefetched = prefetched
+        self._using = using
+        self._query_class = query_class
+        self._timeout = timeout
+
+    def _replace(self, **changes: Any) -> "ModelExecutor":
+        state = {
+            "where": self._where,
+            "order": self._order,
+            "group": self._group,
+            "selected": self._selected,
+            "joined": self._joined,
+            "prefetched": self._prefetched,
+            "using": self._using,
+            "query_class": self._query_class,
+            "timeout": self._timeout,
+        }
+        state.update(changes)
+        return ModelQuery(self._model, **state)
 
     def filter(self, where: Operator) -> QueryExecutor:
-        return ModelExecutor(self._model, where)
+        return self._replace(where=where)
+
+    def order_by(self, *orders: Union[Operator, Order]) -> "ModelExecutor":
+        """
+        Sets the ORDER BY of the query.
+        :param orders: columns or expressions, ascending unless wrapped with .desc()
+        :return ModelExecutor:
+        """
+        return self._replace(
+            order=tuple([order if isinstance(order, Order) else Order(order) for order in orders])
+        )
+
+    def only(self, *columns: DatabaseType) -> "ModelExecutor":
+        """
+        Loads only these columns, and the id, into the fetched models.
+        The others are deferred, see Model.load_deferred.
+        :return ModelExecutor:
+        """
+        names = {column.get_name() for column in columns}
+        return self._replace(selected=self._selection(lambda name: name in names))
+
+    def defer(self, *columns: DatabaseType) -> "ModelExecutor":
+        """
+        Doesn't load these columns into the fetched models, see Model.load_deferred.
+        :return ModelExecutor:
+        """
+        names = {column.get_name() for column in columns}
+        return self._replace(selected=self._selection(lambda name: name not in names))
+
+    def _selection(self, keep: Callable[[str], bool]) -> Tuple[str, ...]:
+        id_column = self._model._id
+        if id_column is None:
+            raise TypeError(f"{self._model.__class__.__name__} has no id column, columns can't be deferred")
+        # the shard key is kept too, saving and deleting the instances route with it
+        kept = {id_column.get_name(), *([self._model._shard_key.get_name()] if self._model._shard_key else [])}
+        return tuple([name for name in self._model.get_columns() if name in kept or keep(name)])
+
+    def using(self, target: str) -> "ModelExecutor":
+        """
+        Routes the reads of the query, e.g. using("primary") to read your own writes.
+        :param target: "primary" or "replica"
+        :return ModelExecutor:
+        """
+        if target not in ("primary", "replica"):
+            raise ValueError("using target must be primary or replica")
+        return self._replace(using=target)
+
+    def query_class(self, name: str) -> "ModelExecutor":
+        """
+        Runs the query in an admission class of the client, e.g. query_class("critical").
+        :return ModelExecutor:
+        """
+        return self._replace(query_class=name)
+
+    def timeout(self, seconds: float) -> "ModelExecutor":
+        """
+        Cancels the query, on the server too, after seconds.
+        :return ModelExecutor:
+        """
+        return self._replace(timeout=seconds)
+
+    def _options(self) -> Dict[str, Any]:
+        timeout = self._timeout
+        if timeout is None:
+            timeout = self._model.get_client().query_timeout(self._query_class)
+        return {"timeout": timeout} if timeout is not None else {}
+
+    def _routes(self) -> bool:
+        """
+        Whether the query picks its shards, else it runs on the current shard or transaction.
+        """
+        client = self._model.get_client()
+        if not client.sharded or Transaction.current(client) is not None:
+            return False
+        shard = current_shard()
+        if self._model._shard_key is None:
+            # unsharded models live on the first shard
+            return shard not in (None, 0)
+        return shard is None
+
+    def _shards(self) -> Optional[List[int]]:
+        """
+        Returns the shards of the rows matched by the query, from the equality on the shard key,
+        else all of them. None when the query runs on the current shard.
+        """
+        if not self._routes():
+            return None
+        key = self._model._shard_key
+        if key is None:
+            return [0]
+        client = self._model.get_client()
+        values = shard_values(self._where, key)
+        if values is None:
+            return list(range(client.shard_count))
+        return sorted({client.shard_for(value) for value in values})
+
+    def _by_shard(self, instances: List["Model"]) -> Dict[int, List["Model"]]:
+        key = self._model._shard_key
+        if key is None:
+            return {0: list(instances)}
+        client = self._model.get_client()
+        name = key.get_name()
+        groups: Dict[int, List["Model"]] = {}
+        for instance in instances:
+            value = instance.get_values().get(name)
+            if value is None:
+                raise ValueError(f"{name} is the shard key, it must be set")
+            groups.setdefault(client.shard_for(value), []).append(instance)
+        return groups
+
+    async def _scatter(self, shards: List[int], call: Callable[[], Awaitable[Any]]) -> List[Any]:
+        """
+        Runs call on the shards concurrently, returns the results in the order of shards.
+        """
+        return list(await asyncio.gather(*[on_shard(shard, call) for shard in shards]))
+
+    def _single_shard(self, shards: List[int], operation: str) -> int:
+        if len(shards) != 1:
+            raise TypeError(f"{operation} spans shards, filter on the shard key or use client.on_shard")
+        return shards[0]
+
+    def select_related(self, *foreign_keys: DatabaseType) -> "ModelExecutor":
+        """
+        Loads the instances referenced by these foreign keys of the model in the same query,
+        with a LEFT JOIN, and attaches them under their related_name.
+        :return ModelExecutor:
+        """
+        for foreign_key in foreign_keys:
+            if not foreign_key.get_reference() or foreign_key.shape()[0] != self._model.table_name:
+                raise TypeError(f"{foreign_key.get_name()} is not a foreign key of {self._model.table_name}")
+        return self._replace(joined=(*self._joined, *foreign_keys))
+
+    def prefetch_related(self, *foreign_keys: DatabaseType) -> "ModelExecutor":
+        """
+        Loads related instances with one WHERE foreign_key = ANY($1) query per foreign key, after the fetch.
+        A foreign key of the model attaches the referenced instance under its related_name,
+        a foreign key of another model referencing this one attaches the list of referencing
+        instances under its reverse_name.
+        :return ModelExecutor:
+        """
+        for foreign_key in foreign_keys:
+            reference = foreign_key.get_reference()
+            if not reference or (
+                foreign_key.shape()[0] != self._model.table_name
+                and reference.model.table_name != self._model.table_name
+            ):
+                raise TypeError(f"{foreign_key.get_name()} doesn't relate to {self._model.table_name}")
+        return self._replace(prefetched=(*self._prefetched, *foreign_keys))
+
+    def _joins(self) -> List[Tuple[DatabaseType, str, "Model"]]:
+        """
+        Returns (foreign key, table alias, referenced model) for each joined foreign key.
+        The first join of a table keeps its name, so conditions on its columns work.
+        """
+        joins = []
+        used = {self._model.table_name}
+        for index, foreign_key in enumerate(self._joined):
+            model = foreign_key.get_reference().model
+            alias = model.table_name if model.table_name not in used else f"{model.table_name}_{index}"
+            used.add(alias)
+            joins.append((foreign_key, alias, model))
+        return joins
 
     def __call__(self, *args, **kwargs):
         return self.filter(*args, **kwargs)
@@ -67,78 +366,1115 @@ class ModelExecutor(QueryExecutor):
     def __await__(self):
         return self.fetchone().__await__()
 
+    def _compile(self, key: Tuple, build: Callable[[ValuesManager], str]) -> str:
+        return self._model.get_client().compile(key, build)
+
+    def _where_shape(self) -> Any:
+        return self._where.shape() if self._where else None
+
+    def _bind_where(self, values: List[Any]) -> List[Any]:
+        return self._where.bind(values) if self._where else values
+
+    def _columns_shape(self) -> Tuple:
+        if not self._joined:
+            return self._selected
+        return self._selected, tuple([foreign_key.shape() for foreign_key in self._joined])
+
+    def _order_shape(self) -> Tuple:
+        if not (self._order or self._group):
+            return None
+        return (
+            tuple([order.shape() for order in self._order]),
+            tuple([group.shape() for group in self._group]),
+        )
+
+    def _select(
+        self,
+        manager: ValuesManager,
+        results: Tuple[Union[Operator, Any], ...],
+        tail: Callable[[ValuesManager], str],
+        after: Callable[[ValuesManager], str] = None,
+    ) -> str:
+        """
+        Renders a SELECT, tail (LIMIT, OFFSET) is rendered last so its placeholders come last.
+        """
+        results_data = [
+            result.build(manager) if isinstance(result, Operator) else result
+            for result in results
+        ]
+        conditions = []
+        if self._where:
+            conditions.append(self._where.build(manager))
+        if after:
+            conditions.append(f"({after(manager)})")
+        table = self._model.table_name
+        joins = self._joins() if self._joined else ()
+        if not results_data and joins:
+            results_data = [f"{table}.{name}" for name in self._selected or self._model.get_columns()]
+            for _, alias, model in joins:
+                results_data.extend([f"{alias}.{name} AS {alias}__{name}" for name in model.get_columns()])
+        elif not results_data and self._selected:
+            results_data = self._selected
+        return (
+            f"SELECT "
+            f"{','.join(results_data) if results_data else '*'} "
+            f"FROM {table}"
+            f"{''.join([f' LEFT JOIN {model.table_name} AS {alias} ON {alias}.{model._id.get_name()}={foreign_key.build(manager)}' for foreign_key, alias, model in joins])} "
+            f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+            f"{'GROUP BY ' + ','.join([group.build(manager) for group in self._group]) if self._group else ''} "
+            f"{'ORDER BY ' + ','.join([order.build(manager) for order in self._order]) if self._order else ''} "
+            f"{tail(manager)}"
+        )
+
+    def _bind_select(self, results: Tuple[Union[Operator, Any], ...], after: List[Any] = ()) -> List[Any]:
+        values = []
+        for result in results:
+            if isinstance(result, Operator):
+                result.bind(values)
+        self._bind_where(values)
+        values.extend(after)
+        for group in self._group:
+            group.bind(values)
+        for order in self._order:
+            order.bind(values)
+        return values
+
+    def _fetch_query(
+        self, results: Tuple[Union[Operator, Any], ...], limit: int = None, offset: int = None
+    ) -> Tuple[str, List[Any]]:
+        query = self._compile(
+            (
+                "fetch",
+                self._model.table_name,
+                results_shape(results),
+                self._columns_shape(),
+                self._where_shape(),
+                self._order_shape(),
+                bool(limit),
+                bool(offset),
+            ),
+            lambda manager: self._select(
+                manager,
+                results,
+                lambda tail: (
+                    f"{'LIMIT ' + tail.add(limit) if limit else ''} "
+                    f"{'OFFSET ' + tail.add(offset) if offset else ''}"
+                ),
+            ),
+        )
+        values = self._bind_select(results)
+        if limit:
+            values.append(limit)
+        if offset:
+            values.append(offset)
+        return query, values
+
+    def _hydrate(self, row: Any, partial: bool) -> Union["Model", PartialModel]:
+        if partial:
+            return PartialModel(self._model, dict(row))
+        if self._joined:
+            return self._hydrate_joined(row)
+        return self._model.from_record(row)
+
+    def _hydrate_joined(self, row: Any) -> "Model":
+        """
+        Splits a row of a select_related query into the model and its referenced instances.
+        """
+        instance = self._model.from_record(
+            {name: row[name] for name in self._selected or self._model.get_columns()}
+        )
+        related = {}
+        for foreign_key, alias, model in self._joins():
+            if row[f"{alias}__{model._id.get_name()}"] is None:
+                related[foreign_key.get_reference().related_name] = None
+            else:
+                related[foreign_key.get_reference().related_name] = model.from_record(
+                    {name: row[f"{alias}__{name}"] for name in model.get_columns()}
+                )
+        instance._related = related
+        return instance
+
+    async def _prefetch(self, instances: List["Model"]):
+        """
+        Runs one WHERE foreign_key = ANY($1) query per prefetch_related foreign key.
+        """
+        for foreign_key in self._prefetched:
+            reference = foreign_key.get_reference()
+            name = foreign_key.get_name()
+            if foreign_key.shape()[0] == self._model.table_name:
+                # each instance references one instance of the other model
+                id_column = reference.model._id
+                ids = {getattr(instance, name) for instance in instances} - {None}
+                rows = await reference.model._fetch_any(id_column, list(ids)) if ids else []
+                by_id = {getattr(row, id_column.get_name()): row for row in rows}
+                for instance in instances:
+                    _attach(instance, reference.related_name, by_id.get(getattr(instance, name)))
+            else:
+                # each instance is referenced by a list of instances of the other model
+                ids = {instance._original_id for instance in instances}
+                rows = await reference.source._fetch_any(foreign_key, list(ids)) if ids else []
+                groups: Dict[Any, List["Model"]] = {}
+                for row in rows:
+                    groups.setdefault(getattr(row, name), []).append(row)
+                for instance in instances:
+                    _attach(instance, reference.reverse_name, groups.get(instance._original_id, []))
+
+    async def _fetch_any(self, column: DatabaseType, values: List[Any]) -> List["Model"]:
+        instances = [
+            self._model.from_record(row)
+            for row in await self._fetch_any_rows(column, values, "prefetch_related")
+        ]
+        self._track(instances)
+        return instances
+
+    async def _fetch_any_rows(self, column: DatabaseType, values: List[Any], operation: str) -> List[Any]:
+        """
+        SELECT * ... WHERE column = ANY($1), returns the records.
+        """
+        if self._routes():
+            client = self._model.get_client()
+            key = self._model._shard_key
+            if key is not None and column.shape() == key.shape():
+                groups: Dict[int, List[Any]] = {}
+                for value in values:
+                    groups.setdefault(client.shard_for(value), []).append(value)
+            else:
+                groups = {shard: values for shard in self._shards()}
+            parts = await asyncio.gather(*[
+                on_shard(shard, lambda keys=keys: self._fetch_any_rows(column, keys, operation))
+                for shard, keys in groups.items()
+            ])
+            return [row for part in parts for row in part]
+
+        started = perf_counter()
+        query = self._compile(
+            ("fetch_any", self._model.table_name, column.get_name()),
+            lambda manager: f"SELECT * FROM {self._model.table_name} WHERE {column.get_name()}=ANY({manager.add(None)})",
+        )
+        return await self._read(operation, "fetch", query, [values], started)
+
+    def _defer(self, instances: List["Model"], results: Tuple[Union[Operator, Any], ...] = ()):
+        """
+        Links instances fetched with deferred columns, so they are loaded together.
+        """
+        if self._selected and not results:
+            for instance in instances:
+                instance._deferred = instances
+
+    def _track(self, instances: Tuple["Model", ...]):
+        session = Session.current(self._model.get_client())
+        if session:
+            session.add_all(instances)
+
+    async def _read(self, operation: str, method: str, query: str, values: List[Any], started: float) -> Any:
+        """
+        Runs a read query through the client's result cache, when enabled.
+        :param operation: the operation reported to the observers
+        :param method: connection method, fetch or fetchrow
+        :param started: perf_counter() taken before building the query
+        """
+        client = self._model.get_client()
+        cache = client.result_cache
+        # reads inside a transaction must see its own writes, using("primary") must not see stale replica rows
+        key = (
+            # the same query reads different rows on each shard
+            cache.key(query if current_shard() is None else f"{current_shard()}:{query}", tuple(values))
+            if cache is not None and Transaction.current(client) is None and self._using != "primary"
+            else None
+        )
+
+        if key is not None:
+            rows = cache.get(key)
+            if rows is not MISSING:
+                return rows
+            tables = (
+                self._model.table_name,
+                *[foreign_key.get_reference().model.table_name for foreign_key in self._joined],
+            )
+            generation = cache.generation(tables)
+
+        rows = await self._run(operation, method, query, values, started)
+
+        if key is not None:
+            cache.set(key, tables, generation, rows)
+        return rows
+
+    async def _run(
+        self, operation: str, method: str, query: str, values: List[Any], started: float, write: bool = False
+    ) -> Any:
+        """
+        Runs a query through Client.query, timing the build and the connection acquire.
+        :param write: invalidate the cached results of the table
+        """
+        client = self._model.get_client()
+        build_time = perf_counter() - started
+        manager = client.get_connection(read=not write, using=self._using, query_class=self._query_class)
+        try:
+            async with manager as connection:
+                acquire_time = perf_counter() - started - build_time
+                result = await client.query(
+                    connection, method, query, values, operation, self._model, build_time, acquire_time,
+                    **self._options(),
+                )
+                if write:
+                    await client.invalidate(self._model.table_name, connection)
+            if client.advisor is not None and operation != "explain":
+                client.advisor.observe(self._model, self._where, query, values)
+        except DISCONNECT_ERRORS:
+            if getattr(manager, "replica", None) is None:
+                raise
+            # the replica is now skipped, reads are safe to retry on the primary
+            return await self._replace(using="primary")._run(operation, method, query, values, started)
+        return result
+
     async def fetch(
         self, *results: Union[Operator, Any], limit: int = None, offset: int = None
     ) -> List["Model"]:
-        async with self._model.get_client().get_connection() as connection:
-            manager: ValuesManager = ValuesManager()
-            results_data = [
-                result.build(manager) if isinstance(result, Operator) else result
-                for result in results
-            ]
-            query = (
-                f"SELECT "
-                f"{','.join(results_data) if results_data else '*'} "
-                f"FROM {self._model.table_name} "
-                f"{'WHERE ' + self._where.build(manager) if self._where else ''} "
-                f"{'LIMIT ' + manager.add(limit) if limit else ''} "
-                f"{'OFFSET ' + manager.add(offset) if offset else ''}"
+        shards = self._shards()
+        if shards is not None:
+            if len(shards) == 1:
+                return await on_shard(shards[0], lambda: self.fetch(*results, limit=limit, offset=offset))
+            if self._group:
+                raise TypeError("group_by spans shards, filter on the shard key or use client.on_shard")
+            # every shard returns its first offset + limit rows, the merge keeps the global window
+            window = limit + (offset or 0) if limit else None
+            parts = await self._scatter(shards, lambda: self.fetch(*results, limit=window))
+            return merge(parts, self._order, limit, offset)
+
+        started = perf_counter()
+        query, values = self._fetch_query(results, limit, offset)
+
+        rows = await self._read("fetch", "fetch", query, values, started)
+        instances = [self._hydrate(row, bool(results)) for row in rows]
+        self._defer(instances, results)
+        if self._prefetched and not results:
+            await self._prefetch(instances)
+
+        if not results:
+            self._track(instances)
+        return instances
+
+    async def stream(
+        self,
+        *results: Union[Operator, Any],
+        batch_size: int = 1000,
+        limit: int = None,
+        offset: int = None,
+    ) -> AsyncIterator[Union["Model", PartialModel]]:
+        """
+        Iterates over the results through a server-side cursor, batch_size rows at a time.
+        The connection is released when the iteration ends or the iterator is closed.
+        :param results: columns to select, full models if empty
+        :param batch_size: rows fetched per round-trip
+        """
+        shards = self._shards()
+        if shards is not None:
+            if len(shards) > 1 and (self._order or limit or offset):
+                raise TypeError("Ordered or limited streams can't span shards, use fetch")
+            # one shard after the other
+            for shard in shards:
+                async for instance in iterate_on_shard(
+                    shard, self.stream(*results, batch_size=batch_size, limit=limit, offset=offset)
+                ):
+                    yield instance
+            return
+
+        started = perf_counter()
+        query, values = self._fetch_query(results, limit, offset)
+
+        async for rows in self._cursor("stream", query, values, batch_size, started):
+            instances = [self._hydrate(row, bool(results)) for row in rows]
+            self._defer(instances, results)
+            if self._prefetched and not results:
+                await self._prefetch(instances)
+            for instance in instances:
+                yield instance
+
+    async def _cursor(
+        self, operation: str, query: str, values: List[Any], batch_size: int, started: float
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Yields the rows of a server-side cursor, batch_size at a time.
+        """
+        client = self._model.get_client()
+        # one event for the whole cursor, execution_time sums the round-trips only
+        event = QueryEvent(operation, self._model, query, len(values), perf_counter() - started)
+
+        options = self._options()
+        async with client.get_connection(read=True, using=self._using, query_class=self._query_class) as connection:
+            event.acquire_time = perf_counter() - started - event.build_time
+            try:
+                async with connection.transaction():
+                    cursor = await connection.cursor(query, *values, **options)
+                    while True:
+                        fetch_started = perf_counter()
+                        rows = await cursor.fetch(batch_size, **options)
+                        event.execution_time += perf_counter() - fetch_started
+                        if not rows:
+                            break
+                        event.rows += len(rows)
+                        yield rows
+            except GeneratorExit:
+                raise
+            except BaseException as e:
+                event.error = e
+                raise
+            finally:
+                client.notify(event)
+
+    async def fetch_columns(
+        self,
+        *columns: Operator,
+        batch_size: int = 10000,
+        limit: int = None,
+        offset: int = None,
+    ) -> Dict[str, Any]:
+        """
+        Fetches columns into NumPy masked arrays, NULLs are masked, without creating models.
+        Rows are read through a server-side cursor, batch_size at a time. Requires numpy.
+        :param columns: columns, or expressions named with .label()
+        :param batch_size: rows fetched per round-trip
+        :return Dict[str, numpy.ma.MaskedArray]: one array per column name
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "fetch_columns"), lambda: self.fetch_columns(*columns, batch_size=batch_size, limit=limit, offset=offset))
+
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("fetch_columns requires numpy, install bladeorm[numpy]") from None
+
+        started = perf_counter()
+        names = []
+        dtypes = []
+        for column in columns:
+            if isinstance(column, DatabaseType):
+                names.append(column.get_name())
+                dtypes.append(column_dtype(column))
+            elif isinstance(column, Alias):
+                names.append(column.second)
+                dtypes.append(None)
+            else:
+                raise TypeError("fetch_columns takes columns, or expressions named with .label()")
+
+        query, values = self._fetch_query(columns, limit, offset)
+        # per column, (data, mask or None) per batch
+        chunks: List[List[Tuple[Any, Any]]] = [[] for _ in columns]
+        async for rows in self._cursor("fetch_columns", query, values, batch_size, started):
+            for index, dtype in enumerate(dtypes):
+                column_values = [row[index] for row in rows]
+                if not column_values.count(None):
+                    chunks[index].append((numpy.array(column_values, dtype=dtype), None))
+                    continue
+                fill = _null_fill(dtype)
+                chunks[index].append((
+                    numpy.array([fill if value is None else value for value in column_values], dtype=dtype),
+                    numpy.array([value is None for value in column_values]),
+                ))
+
+        arrays = {}
+        for name, dtype, column_chunks in zip(names, dtypes, chunks):
+            if not column_chunks:
+                arrays[name] = numpy.ma.masked_array(numpy.array([], dtype=dtype or object))
+                continue
+            data = numpy.concatenate([chunk for chunk, _ in column_chunks])
+            mask = numpy.ma.nomask
+            if any([chunk_mask is not None for _, chunk_mask in column_chunks]):
+                mask = numpy.concatenate([
+                    numpy.zeros(len(chunk), dtype=bool) if chunk_mask is None else chunk_mask
+                    for chunk, chunk_mask in column_chunks
+                ])
+            arrays[name] = numpy.ma.masked_array(data, mask=mask)
+        return arrays
+
+    async def fetch_json(
+        self, *columns: Operator, limit: int = None, offset: int = None
+    ) -> bytes:
+        """
+        Fetches the results as a JSON array of objects, built by PostgreSQL with json_agg.
+        :param columns: columns, or expressions named with .label(), all the columns if empty
+        :return bytes: the encoded array, ready to be sent as a response body
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "fetch_json"), lambda: self.fetch_json(*columns, limit=limit, offset=offset))
+
+        started = perf_counter()
+        query, values = self._fetch_query(columns, limit, offset)
+        query = f"SELECT coalesce(json_agg(t),'[]')::text FROM ({query}) t"
+
+        result = await self._read("fetch_json", "fetchval", query, values, started)
+        return result.encode()
+
+    async def stream_json(
+        self,
+        *columns: Operator,
+        batch_size: int = 1000,
+        limit: int = None,
+        offset: int = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Iterates over the results as JSON objects, one per row, through a server-side cursor.
+        :param columns: columns, or expressions named with .label(), all the columns if empty
+        :param batch_size: rows fetched per round-trip
+        """
+        shards = self._shards()
+        if shards is not None:
+            if len(shards) > 1 and (self._order or limit or offset):
+                raise TypeError("Ordered or limited streams can't span shards, use fetch_json")
+            for shard in shards:
+                async for document in iterate_on_shard(
+                    shard, self.stream_json(*columns, batch_size=batch_size, limit=limit, offset=offset)
+                ):
+                    yield document
+            return
+
+        started = perf_counter()
+        query, values = self._fetch_query(columns, limit, offset)
+        query = f"SELECT row_to_json(t)::text FROM ({query}) t"
+
+        async for rows in self._cursor("stream_json", query, values, batch_size, started):
+            for row in rows:
+                yield row[0].encode()
+
+    async def explain(
+        self,
+        *results: Union[Operator, Any],
+        analyze: bool = False,
+        buffers: bool = False,
+        limit: int = None,
+        offset: int = None,
+    ) -> Plan:
+        """
+        Explains the SELECT fetch would run.
+        :param analyze: run the query, for the actual times and rows
+        :param buffers: report the buffers used, with analyze
+        :return Plan:
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "explain"), lambda: self.explain(*results, analyze=analyze, buffers=buffers, limit=limit, offset=offset))
+
+        started = perf_counter()
+        query, values = self._fetch_query(results, limit, offset)
+        options = ["FORMAT JSON", *(["ANALYZE"] if analyze else []), *(["BUFFERS"] if buffers else [])]
+        query = f"EXPLAIN ({', '.join(options)}) {query}"
+
+        return Plan.parse(await self._run("explain", "fetchval", query, values, started))
+
+    async def export(
+        self,
+        output: Any,
+        format: str = "csv",
+        columns: Iterable[Operator] = (),
+        limit: int = None,
+        offset: int = None,
+        **options: Any,
+    ) -> int:
+        """
+        Streams the matching rows to output with COPY (SELECT ...) TO STDOUT, no model is created.
+        :param output: a path, a file-like object, or a coroutine function called with each chunk of bytes
+        :param format: csv, text or binary
+        :param columns: columns, or expressions named with .label(), all the columns if empty
+        :param options: other COPY options, e.g. header=True or delimiter=";"
+        :return int: the number of exported rows
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "export"), lambda: self.export(output, format, columns, limit, offset, **options))
+
+        if format not in COPY_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(COPY_FORMATS)}")
+
+        client = self._model.get_client()
+        started = perf_counter()
+        query, values = self._fetch_query(tuple(columns), limit, offset)
+        build_time = perf_counter() - started
+        # not retried on the primary, part of the rows may already be written
+        async with client.get_connection(read=True, using=self._using, query_class=self._query_class) as connection:
+            status = await client.query(
+                connection,
+                "copy_from_query",
+                query,
+                values,
+                "export",
+                self._model,
+                build_time,
+                perf_counter() - started - build_time,
+                output=output,
+                format=format,
+                **{**self._options(), **options},
             )
+        return affected(status)
 
-            rows = await connection.fetch(query, *manager.get_storage())
-            return [PartialModel(self._model, dict(row)) if results_data else self._model.create_instance(dict(row), True) for row in rows]
+    async def import_from(
+        self,
+        source: Any,
+        format: str = "csv",
+        columns: Iterable[DatabaseType] = (),
+        **options: Any,
+    ) -> int:
+        """
+        Loads rows into the table with COPY ... FROM STDIN, streaming them from source.
+        :param source: a path, a file-like object, or an async iterable of bytes
+        :param format: csv, text or binary
+        :param columns: columns in the order of the data, all the table columns if empty
+        :param options: other COPY options, e.g. header=True or delimiter=";"
+        :return int: the number of imported rows
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "import_from"), lambda: self.import_from(source, format, columns, **options))
 
-    async def fetchone(self, *results: Union[Operator, Any]) -> "Model":
-        async with self._model.get_client().get_connection() as connection:
-            manager: ValuesManager = ValuesManager()
-            results_data = [
-                result.build(manager) if isinstance(result, Operator) else result
-                for result in results
-            ]
-            query = (
-                f"SELECT "
-                f"{','.join(results_data) if results_data else '*'} "
-                f"FROM {self._model.table_name} "
-                f"{'WHERE ' + self._where.build(manager) if self._where else ''} "
-                f"LIMIT 1"
+        if format not in COPY_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(COPY_FORMATS)}")
+
+        names = [column.get_name() for column in columns] or None
+        client = self._model.get_client()
+        started = perf_counter()
+        async with client.get_connection(query_class=self._query_class) as connection:
+            # COPY has no SQL text, the table name is reported as the query
+            status = await client.query(
+                connection,
+                "copy_to_table",
+                self._model.table_name,
+                (),
+                "import",
+                self._model,
+                acquire_time=perf_counter() - started,
+                source=source,
+                format=format,
+                columns=names,
+                **{**self._options(), **options},
             )
+            await client.invalidate(self._model.table_name, connection)
+        return affected(status)
 
-            row = await connection.fetchrow(query, *manager.get_storage())
-            return PartialModel(self._model, dict(row)) if results_data else self._model.create_instance(dict(row), True) if row else None
+    async def paginate(self, after: str = None, size: int = 50) -> Tuple[List["Model"], Optional[str]]:
+        """
+        Fetches a page with keyset (seek) pagination: the next page starts right after
+        the last row of the previous one, so deep pages cost as much as the first.
+        Requires order_by on columns, the id column is appended as a tie-breaker.
+        :param after: token returned with the previous page
+        :param size: rows per page
+        :return Tuple[List[Model], Optional[str]]: the page and the token of the next one, None if it's the last
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "paginate"), lambda: self.paginate(after, size))
 
-    async def update(self, **values: Dict[str, Union[Operator, Any]]):
-        async with self._model.get_client().get_connection() as connection:
-            manager: ValuesManager = ValuesManager()
-            query = (
+        started = perf_counter()
+        order = self._keyset_order()
+        executor = self._replace(order=order)
+        cursor = decode_cursor(after, order) if after else None
+
+        def keyset(manager: ValuesManager) -> str:
+            placeholders = [manager.add(value) for value in cursor]
+            if len({item.descending for item in order}) == 1:
+                return (
+                    f"({','.join([item.expression.build(manager) for item in order])}) "
+                    f"{'<' if order[0].descending else '>'} ({','.join(placeholders)})"
+                )
+            # mixed directions can't use a row comparison
+            return " OR ".join([
+                "(" + " AND ".join(
+                    [f"{item.expression.build(manager)}={placeholders[index]}" for index, item in enumerate(order[:position])]
+                    + [f"{order[position].expression.build(manager)}{'<' if order[position].descending else '>'}{placeholders[position]}"]
+                ) + ")"
+                for position in range(len(order))
+            ])
+
+        query = self._compile(
+            (
+                "paginate",
+                self._model.table_name,
+                self._columns_shape(),
+                self._where_shape(),
+                executor._order_shape(),
+                cursor is not None,
+            ),
+            lambda manager: executor._select(
+                manager, (), lambda tail: f"LIMIT {tail.add(size + 1)}", keyset if cursor is not None else None
+            ),
+        )
+        values = executor._bind_select((), cursor or ())
+        values.append(size + 1)
+
+        rows = await self._read("paginate", "fetch", query, values, started)
+        instances = [self._hydrate(row, False) for row in rows[:size]]
+        self._defer(instances)
+        if self._prefetched:
+            await self._prefetch(instances)
+        self._track(instances)
+
+        if len(rows) <= size:
+            return instances, None
+        return instances, encode_cursor([getattr(instances[-1], item.expression.get_name()) for item in order])
+
+    def _keyset_order(self) -> Tuple[Order, ...]:
+        if not self._order:
+            raise TypeError("paginate requires order_by")
+        for item in self._order:
+            if not isinstance(item.expression, DatabaseType):
+                raise TypeError("paginate can only order by columns")
+
+        order = self._order
+        id_column = self._model._id
+        if id_column is not None and id_column.get_name() not in [item.expression.get_name() for item in order]:
+            order = (*order, Order(id_column, order[-1].descending))
+        return order
+
+    async def _scalar(self, function: Function) -> Any:
+        shards = self._shards()
+        if shards is not None:
+            if len(shards) == 1:
+                return await on_shard(shards[0], lambda: self._scalar(function))
+            if function.distinct or not isinstance(function, (Count, Sum, Min, Max)):
+                raise TypeError(f"{function.operator}{' distinct' if function.distinct else ''} can't span shards")
+            values = [value for value in await self._scatter(shards, lambda: self._scalar(function)) if value is not None]
+            if isinstance(function, Count):
+                return sum(values)
+            if isinstance(function, Sum):
+                return sum(values) if values else None
+            return (min if isinstance(function, Min) else max)(values, default=None)
+
+        started = perf_counter()
+        executor = self._replace(order=(), group=())
+        query = self._compile(
+            ("scalar", self._model.table_name, function.shape(), self._columns_shape(), self._where_shape()),
+            lambda manager: executor._select(manager, (function,), lambda tail: ""),
+        )
+        return await self._read(
+            function.operator.lower(), "fetchval", query, executor._bind_select((function,)), started
+        )
+
+    async def count(self, column: Operator = None, distinct: bool = False) -> int:
+        """
+        SELECT count(*), or count(column) to skip NULLs.
+        """
+        return await self._scalar(Count(column, distinct))
+
+    async def exists(self) -> bool:
+        shards = self._shards()
+        if shards is not None:
+            return any(await self._scatter(shards, self.exists))
+
+        started = perf_counter()
+        executor = self._replace(order=(), group=())
+        query = self._compile(
+            ("exists", self._model.table_name, self._columns_shape(), self._where_shape()),
+            lambda manager: f"SELECT EXISTS({executor._select(manager, ('1',), lambda tail: 'LIMIT 1')})",
+        )
+        return await self._read("exists", "fetchval", query, executor._bind_where([]), started)
+
+    async def sum(self, column: Operator, distinct: bool = False) -> Any:
+        return await self._scalar(Sum(column, distinct))
+
+    async def avg(self, column: Operator, distinct: bool = False) -> Any:
+        shards = self._shards()
+        if shards is not None and len(shards) > 1 and not distinct:
+            count = await self.count(column)
+            return await self.sum(column) / count if count else None
+        return await self._scalar(Avg(column, distinct))
+
+    async def min(self, column: Operator) -> Any:
+        return await self._scalar(Min(column))
+
+    async def max(self, column: Operator) -> Any:
+        return await self._scalar(Max(column))
+
+    def group_by(self, *columns: Operator) -> "ModelExecutor":
+        return self._replace(group=columns)
+
+    async def aggregate(self, **aggregates: Operator) -> List[PartialModel]:
+        """
+        Runs the aggregates, per group when group_by is set.
+        :param aggregates: name=expression, e.g. total=Sum(User.score)
+        :return List[PartialModel]: the group columns followed by the aggregates
+        """
+        shards = self._shards()
+        if shards is not None:
+            return await on_shard(self._single_shard(shards, "aggregate"), lambda: self.aggregate(**aggregates))
+
+        results = (*self._group, *[expression.label(name) for name, expression in aggregates.items()])
+        return await self.fetch(*results)
+
+    async def fetchone(self, *results: Union[Operator, Any]) -> "Model":
+        shards = self._shards()
+        if shards is not None:
+            if len(shards) == 1:
+                return await on_shard(shards[0], lambda: self.fetchone(*results))
+            instances = await self.fetch(*results, limit=1)
+            return instances[0] if instances else None
+
+        started = perf_counter()
+        query = self._compile(
+            (
+                "fetchone",
+                self._model.table_name,
+                results_shape(results),
+                self._columns_shape(),
+                self._where_shape(),
+                self._order_shape(),
+            ),
+            lambda manager: self._select(manager, results, lambda tail: "LIMIT 1"),
+        )
+
+        row = await self._read("fetchone", "fetchrow", query, self._bind_select(results), started)
+        if row is None:
+            return None
+        instance = self._hydrate(row, bool(results))
+        self._defer([instance], results)
+        if self._prefetched and not results:
+            await self._prefetch([instance])
+        if not results:
+            self._track((instance,))
+        return instance
+
+    async def update(
+        self, returning: bool = False, **values: Dict[str, Union[Operator, Any]]
+    ) -> Union[int, List["Model"]]:
+        """
+        Updates the matching rows.
+        :param returning: return the updated rows as models, with RETURNING *
+        :param values: column=value or expression
+        :return Union[int, List[Model]]: the number of updated rows, or the updated models
+        """
+        shards = self._shards()
+        if shards is not None:
+            key = self._model._shard_key
+            if key is not None and key.get_name() in values:
+                raise ValueError(f"{key.get_name()} is the shard key, it can't be updated")
+            parts = await self._scatter(shards, lambda: self.update(returning, **values))
+            return [instance for part in parts for instance in part] if returning else sum(parts)
+
+        started = perf_counter()
+        query = self._compile(
+            (
+                "update",
+                self._model.table_name,
+                tuple((key, shape(value)) for key, value in values.items()),
+                self._where_shape(),
+                returning,
+            ),
+            lambda manager: (
                 f"UPDATE {self._model.table_name} "
                 f"SET {','.join([f'{key}={value.build(manager) if isinstance(value, Operator) else manager.add(value)}' for key, value in values.items()])} "
                 f"{'WHERE ' + self._where.build(manager) if self._where else ''}"
-            )
+                f"{' RETURNING *' if returning else ''}"
+            ),
+        )
+        parameters = []
+        for value in values.values():
+            bind(value, parameters)
 
-            await connection.execute(query, *manager.get_storage())
+        result = await self._run(
+            "update", "fetch" if returning else "execute", query, self._bind_where(parameters), started, True
+        )
 
-    async def delete(self):
-        async with self._model.get_client().get_connection() as connection:
-            manager: ValuesManager = ValuesManager()
-            query = (
+        if not returning:
+            return affected(result)
+        instances = [self._hydrate(row, False) for row in result]
+        self._track(instances)
+        return instances
+
+    async def delete(self) -> int:
+        """
+        Deletes the matching rows.
+        :return int: the number of deleted rows
+        """
+        shards = self._shards()
+        if shards is not None:
+            return sum(await self._scatter(shards, self.delete))
+
+        started = perf_counter()
+        query = self._compile(
+            ("delete", self._model.table_name, self._where_shape()),
+            lambda manager: (
                 f"DELETE FROM {self._model.table_name} "
                 f"{'WHERE ' + self._where.build(manager) if self._where else ''}"
-            )
+            ),
+        )
 
-            await connection.execute(query, *manager.get_storage())
+        status = await self._run("delete", "execute", query, self._bind_where([]), started, True)
+        return affected(status)
 
-    async def insert(self, model: "Model"):
-        async with self._model.get_client().get_connection() as connection:
-            manager: ValuesManager = ValuesManager()
-            columns = []
-            values = []
-            for column, value in model.get_values().items():
-                columns.append(column)
-                values.append(manager.add(value))
+    async def insert(self, model: "Model") -> int:
+        """
+        Inserts an instance and copies the row returned by the server into it,
+        so serials and SQL defaults are populated.
+        :return int: the number of inserted rows
+        """
+        if self._routes():
+            [shard] = self._by_shard([model])
+            return await on_shard(shard, lambda: self.insert(model))
 
-            query = (
+        started = perf_counter()
+        values = model.get_values()
+        columns = tuple(values)
+        query = self._compile(
+            ("insert", self._model.table_name, columns),
+            lambda manager: (
                 f"INSERT INTO {self._model.table_name} "
                 f"({','.join(columns)}) "
-                f"VALUES ({','.join(values)})"
+                f"VALUES ({','.join([manager.add(value) for value in values.values()])}) "
+                f"RETURNING *"
+            ),
+        )
+
+        row = await self._run("insert", "fetchrow", query, list(values.values()), started, True)
+
+        values.update(row.items())
+        return 1
+
+    async def insert_many(self, models: List["Model"], batch_size: int = 1000) -> int:
+        """
+        Inserts many instances with COPY, one stream per column set.
+        COPY can't return rows: missing ids are drawn from the id sequence beforehand,
+        other server generated values are not populated.
+        :param models: instances to insert
+        :param batch_size: max rows sent per COPY
+        :return int: the number of inserted rows
+        """
+        if self._routes():
+            return sum(await asyncio.gather(*[
+                # Model.insert_many returns the instances
+                on_shard(shard, lambda group=group: ModelExecutor.insert_many(self, group, batch_size))
+                for shard, group in self._by_shard(models).items()
+            ]))
+
+        client = self._model.get_client()
+        count = 0
+        started = perf_counter()
+        async with client.get_connection(query_class=self._query_class) as connection:
+            acquire_time = perf_counter() - started
+            async with connection.transaction():
+                await self._allocate_ids(connection, models)
+                groups: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+                for model in models:
+                    values = model.get_values()
+                    groups.setdefault(tuple(values), []).append(tuple(values.values()))
+
+                for columns, records in groups.items():
+                    for start in range(0, len(records), batch_size):
+                        # COPY has no SQL text, the table name is reported as the query
+                        status = await client.query(
+                            connection,
+                            "copy_records_to_table",
+                            self._model.table_name,
+                            (),
+                            "insert_many",
+                            self._model,
+                            acquire_time=acquire_time,
+                            records=records[start:start + batch_size],
+                            columns=columns,
+                            **self._options(),
+                        )
+                        count += affected(status)
+                        acquire_time = 0.0
+            await client.invalidate(self._model.table_name, connection)
+        return count
+
+    async def _allocate_ids(self, connection: Any, models: List["Model"]):
+        """
+        Sets the id of the instances without one with nextval on the id sequence,
+        so rows inserted without RETURNING, or returned in any order, map back to their instance.
+        Ids without a sequence, e.g. with a SQL default, are left to the database.
+        """
+        id_column = self._model._id
+        if id_column is None:
+            return
+        name = id_column.get_name()
+        missing = [model for model in models if model.get_values().get(name) is None]
+        if not missing:
+            return
+        # no rows when the column has no sequence
+        ids = await self._model.get_client().query(
+            connection,
+            "fetch",
+            f"SELECT nextval(sequence) "
+            f"FROM pg_get_serial_sequence('{self._model.table_name}', '{name}') AS sequence, generate_series(1, $1) "
+            f"WHERE sequence IS NOT NULL",
+            [len(missing)],
+            "allocate_ids",
+            self._model,
+        )
+        for model, row in zip(missing, ids):
+            model.get_values()[name] = row[0]
+
+    def _insert_rows_query(
+        self,
+        columns: Tuple[str, ...],
+        count: int,
+        conflict: Tuple[str, ...] = None,
+        update: Tuple[str, ...] = (),
+        returning: bool = False,
+    ) -> str:
+        return self._compile(
+            ("insert_rows", self._model.table_name, columns, count, conflict, update, returning),
+            lambda manager: (
+                f"INSERT INTO {self._model.table_name} "
+                f"({','.join(columns)}) "
+                f"VALUES {','.join(['(' + ','.join([manager.add(None) for _ in columns]) + ')' for _ in range(count)])}"
+                + (
+                    f" ON CONFLICT ({','.join(conflict)}) "
+                    + (f"DO UPDATE SET {','.join([f'{column}=EXCLUDED.{column}' for column in update])}" if update else "DO NOTHING")
+                    if conflict else ""
+                )
+                + (" RETURNING *" if returning else "")
+            ),
+        )
+
+    async def upsert_rows(
+        self,
+        models: List["Model"],
+        conflict: Union[DatabaseType, Iterable[DatabaseType]],
+        update: Iterable[DatabaseType] = None,
+        batch_size: int = 1000,
+        returning: bool = False,
+    ) -> int:
+        """
+        INSERT ... ON CONFLICT (conflict) DO UPDATE SET column = EXCLUDED.column, or DO NOTHING.
+        Rows are grouped per column set, and only the last row of each conflict key is kept.
+        Rows with a NULL in the conflict key never conflict and are all kept.
+        :param models: instances to upsert
+        :param conflict: column(s) of the unique constraint
+        :param update: columns to overwrite on conflict, all the others by default, empty for DO NOTHING
+        :param batch_size: max rows per statement
+        :param returning: copy the inserted or updated rows back into the instances, rows skipped by DO NOTHING are left as they are
+        :return int: the number of inserted or updated rows
+        """
+        if self._routes():
+            return sum(await asyncio.gather(*[
+                on_shard(shard, lambda group=group: self.upsert_rows(group, conflict, update, batch_size, returning))
+                for shard, group in self._by_shard(models).items()
+            ]))
+
+        conflict = (conflict,) if isinstance(conflict, DatabaseType) else tuple(conflict)
+        conflict_names = tuple([column.get_name() for column in conflict])
+        update_names = tuple([column.get_name() for column in update]) if update is not None else None
+
+        # column set -> conflict key -> instances, the last one is sent
+        groups: Dict[Tuple[str, ...], Dict[Any, List["Model"]]] = {}
+        for model in models:
+            values = model.get_values()
+            key = tuple([values.get(name) for name in conflict_names])
+            if None in key:
+                # NULL never equals NULL in a unique constraint, the row is always inserted
+                key = model
+            groups.setdefault(tuple(values), {}).setdefault(key, []).append(model)
+
+        client = self._model.get_client()
+        count = 0
+        started = perf_counter()
+        async with client.get_connection(query_class=self._query_class) as connection:
+            acquire_time = perf_counter() - started
+            async with connection.transaction():
+                for columns, keys in groups.items():
+                    updates = update_names if update_names is not None else tuple(
+                        [column for column in columns if column not in conflict_names]
+                    )
+                    size = max(1, min(batch_size, MAX_PARAMETERS // len(columns)))
+                    keyed = [item for item in keys.items() if isinstance(item[0], tuple)]
+                    batches = [keyed[start:start + size] for start in range(0, len(keyed), size)]
+                    # returned rows map back by conflict key, rows without one are sent alone
+                    loose = [item for item in keys.items() if not isinstance(item[0], tuple)]
+                    loose_size = 1 if returning else size
+                    batches += [loose[start:start + loose_size] for start in range(0, len(loose), loose_size)]
+
+                    for batch in batches:
+                        build_started = perf_counter()
+                        query = self._insert_rows_query(columns, len(batch), conflict_names, updates, returning)
+                        values = [value for _, instances in batch for value in instances[-1].get_values().values()]
+                        result = await client.query(
+                            connection, "fetch" if returning else "execute", query, values, "upsert", self._model,
+                            perf_counter() - build_started, acquire_time, **self._options(),
+                        )
+                        acquire_time = 0.0
+                        if not returning:
+                            count += affected(result)
+                            continue
+
+                        count += len(result)
+                        rows = {tuple([row[name] for name in conflict_names]): row for row in result}
+                        for key, instances in batch:
+                            row = (result[0] if result else None) if len(batch) == 1 else rows.get(key)
+                            if row is not None:
+                                for instance in instances:
+                                    instance.get_values().update(row.items())
+            await client.invalidate(self._model.table_name, connection)
+        return count
+
+    def _update_rows_query(self, columns: Tuple[str, ...], count: int) -> str:
+        """
+        UPDATE ... FROM (VALUES ...), rows are (original id, *columns).
+        The first row is cast to the column types, the others are inferred from it.
+        """
+        table = self._model.table_name
+        model_columns = self._model.get_columns()
+        id_name = self._model._id.get_name()
+        types = (model_columns[id_name].get_sql_type(), *[model_columns[column].get_sql_type() for column in columns])
+
+        def build(manager: ValuesManager) -> str:
+            rows = [
+                "(" + ",".join([manager.add(None) + (f"::{cast}" if row == 0 else "") for cast in types]) + ")"
+                for row in range(count)
+            ]
+            return (
+                f"UPDATE {table} "
+                f"SET {','.join([f'{column}=v.{column}' for column in columns])} "
+                f"FROM (VALUES {','.join(rows)}) AS v(_key,{','.join(columns)}) "
+                f"WHERE {table}.{id_name}=v._key"
             )
-            await connection.execute(query, *manager.get_storage())
+
+        return self._compile(("update_rows", table, columns, count), build)
+
+    async def _load_deferred(self, instances: List["Model"], columns: Tuple[str, ...]):
+        """
+        Loads the deferred columns of instances with one SELECT ... WHERE id = ANY($1).
+        Values already loaded or changed are kept.
+        """
+        if self._routes():
+            await asyncio.gather(*[
+                on_shard(shard, lambda group=group: self._load_deferred(group, columns))
+                for shard, group in self._by_shard(instances).items()
+            ])
+            return
+
+        started = perf_counter()
+        id_name = self._model._id.get_name()
+        query = self._compile(
+            ("load_deferred", self._model.table_name, columns),
+            lambda manager: (
+                f"SELECT {','.join((id_name, *columns))} FROM {self._model.table_name} "
+                f"WHERE {id_name}=ANY({manager.add(None)})"
+            ),
+        )
+        ids = [instance._original_id for instance in instances]
+        rows = await self._read("load_deferred", "fetch", query, [ids], started)
+
+        rows_by_id = {row[id_name]: row for row in rows}
+        for instance in instances:
+            row = rows_by_id.get(instance._original_id)
+            if row is None:
+                continue
+            values = instance.get_values()
+            for column in columns:
+                if column not in values:
+                    values[column] = row[column]
+
+    def _delete_ids_query(self) -> str:
+        return self._compile(
+            ("delete_ids", self._model.table_name),
+            lambda manager: (
+                f"DELETE FROM {self._model.table_name} "
+                f"WHERE {self._model._id.get_name()}=ANY({manager.add(None)})"
+            ),
+        )
+
+
+class ModelQuery(ModelExecutor):
+    """
+    Query on a model, returned by filter, order_by and the other builders of ModelExecutor.
+    """
@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+import asyncio
+import logging
+import time
+import asyncpg
+
+if TYPE_CHECKING:
+    from .client import Client
+
+
+# Errors meaning the server can't be reached while connecting or acquiring, the primary is used instead
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.ConnectionDoesNotExistError,
+)
+
+# Errors meaning an acquired connection was lost, a read failing with them is retried on the primary.
+# Query timeouts are not among them: they propagate and leave the replica healthy.
+DISCONNECT_ERRORS = (
+    ConnectionError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.ConnectionDoesNotExistError,
+)
+
+logger = logging.getLogger("bladeorm.replica")
+
+
+class Replica:
+    """
+    Connection pool of a read replica, skipped for retry_after seconds after a connection error.
+    """
+
+    def __init__(self, dsn: str, retry_after: float = 5):
+        self.dsn = dsn
+        self.retry_after = retry_after
+        self.pool = None
+        self._failed_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self._failed_until <= time.monotonic()
+
+    @property
+    def busy(self) -> int:
+        if self.pool is None:
+            return 0
+        return self.pool.get_size() - self.pool.get_idle_size()
+
+    def failed(self, error: BaseException):
+        logger.warning("replica %s unavailable for %ss: %r", self.dsn, self.retry_after, error)
+        self._failed_until = time.monotonic() + self.retry_after
+
+    async def connect(self, **pool_kwargs: Any) -> bool:
+        async with self._lock:
+            if self.pool is not None:
+                return True
+            try:
+                self.pool = await asyncpg.create_pool(self.dsn, **pool_kwargs)
+            except CONNECTION_ERRORS as e:
+                self.failed(e)
+                return False
+            return True
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        if self.pool is None:
+            return {"size": 0, "idle": 0, "used": 0, "max": 0, "healthy": False}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {"size": size, "idle": idle, "used": size - idle, "max": self.pool.get_max_size(), "healthy": self.healthy}
+
+
+class ReplicaConnection:
+    """
+    Context manager acquiring a connection from a replica, or from the primary
+    when the replica can't give one. Connection errors and lost connections mark the replica unhealthy.
+    """
+
+    def __init__(self, client: "Client", replica: Replica):
+        self._client = client
+        self.replica: Optional[Replica] = replica
+        self._acquire = None
+
+    async def __aenter__(self) -> Any:
+        replica = self.replica
+        if replica.pool is not None or await replica.connect(**self._client._pool_kwargs):
+            try:
+                self._acquire = replica.pool.acquire()
+                return await self._acquire.__aenter__()
+            except CONNECTION_ERRORS as e:
+                replica.failed(e)
+
+        self.replica = None
+        self._acquire = self._client.acquire()
+        return await self._acquire.__aenter__()
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        if self.replica is not None and isinstance(exc, DISCONNECT_ERRORS):
+            self.replica.failed(exc)
+        await self._acquire.__aexit__(exc_type, exc, traceback)
+
+
+def choose(replicas: List[Replica], strategy: str, counter: int) -> Optional[Replica]:
+    """
+    Returns a healthy replica, None if all of them are failing.
+    :param strategy: round_robin or least_busy
+    :param counter: increasing number spreading the round robin
+    """
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    start = counter % len(healthy)
+    if strategy == "least_busy":
+        # ties go round robin too
+        return min(healthy[start:] + healthy[:start], key=lambda replica: replica.busy)
+    return healthy[start]
@@ -0,0 +1,147 @@
+from contextvars import ContextVar
+from typing import Dict, Tuple, List, Any, Iterable, Optional, TYPE_CHECKING
+from .shard import current_shard
+
+if TYPE_CHECKING:
+    from .client import Client
+    from .model import Model
+
+
+# PostgreSQL accepts at most 32767 bind parameters per statement
+MAX_PARAMETERS = 32767
+
+_current_session: ContextVar[Optional["Session"]] = ContextVar("bladeorm_session", default=None)
+
+
+class Session:
+    """
+    Unit of work: tracks new, dirty and deleted instances and flushes them
+    with grouped statements, inside one transaction on one connection.
+    """
+
+    def __init__(self, client: "Client", batch_size: int = 1000):
+        self._client = client
+        self._batch_size = batch_size
+        self._tracked: Dict["Model", None] = {}
+        self._deleted: Dict["Model", None] = {}
+        self._token = None
+
+    @staticmethod
+    def current(client: "Client") -> Optional["Session"]:
+        session = _current_session.get()
+        return session if session is not None and session._client is client else None
+
+    def add(self, instance: "Model"):
+        self._deleted.pop(instance, None)
+        self._tracked[instance] = None
+
+    def add_all(self, instances: Iterable["Model"]):
+        for instance in instances:
+            self.add(instance)
+
+    def delete(self, instance: "Model"):
+        self._tracked.pop(instance, None)
+        if instance._saved:
+            instance._id_check()
+            self._deleted[instance] = None
+
+    async def flush(self):
+        """
+        Sends every pending change: multi-row INSERTs (one row at a time for models
+        without an id sequence), UPDATE ... FROM (VALUES ...)
+        per changed column set and DELETE ... WHERE id = ANY($1).
+        """
+        inserts: Dict[Tuple["Model", Tuple[str, ...]], List["Model"]] = {}
+        updates: Dict[Tuple["Model", Tuple[str, ...]], List["Model"]] = {}
+        deletes: Dict["Model", List["Model"]] = {}
+
+        for instance in self._tracked:
+            if not instance._saved:
+                key = (instance._original_object, tuple(instance.get_values()))
+                inserts.setdefault(key, []).append(instance)
+            elif instance._updated_columns:
+                instance._id_check()
+                key = (instance._original_object, tuple(sorted(instance._updated_columns)))
+                updates.setdefault(key, []).append(instance)
+
+        for instance in self._deleted:
+            deletes.setdefault(instance._original_object, []).append(instance)
+
+        if not (inserts or updates or deletes):
+            return
+
+        client = self._client
+        if client.sharded and current_shard() is None and any(
+            [model._shard_key is not None for model in [key[0] for key in inserts] + [key[0] for key in updates] + list(deletes)]
+        ):
+            raise TypeError("A session flushes on one shard, open it inside client.on_shard")
+        async with client.get_connection() as connection:
+            async with connection.transaction():
+                for (model, _), instances in inserts.items():
+                    # RETURNING has no guaranteed order, rows map back to their instance by id
+                    await model._allocate_ids(connection, instances)
+                    columns = tuple(instances[0].get_values())
+                    id_name = model._id.get_name() if model._id is not None else None
+                    if id_name and any([instance.get_values().get(id_name) is None for instance in instances]):
+                        # ids left to a SQL default are only known after the insert
+                        id_name = None
+                    size = None if id_name else 1
+                    for batch in self._batches(instances, len(columns), size):
+                        values = []
+                        for instance in batch:
+                            values.extend(instance.get_values().values())
+                        rows = await client.query(
+                            connection, "fetch", model._insert_rows_query(columns, len(batch), returning=True),
+                            values, "flush_insert", model,
+                        )
+                        # copy SQL defaults back
+                        if id_name:
+                            rows = {row[id_name]: row for row in rows}
+                            for instance in batch:
+                                instance.get_values().update(rows[instance.get_values()[id_name]].items())
+                        else:
+                            batch[0].get_values().update(rows[0].items())
+
+                for (model, columns), instances in updates.items():
+                    for batch in self._batches(instances, len(columns) + 1):
+                        values = []
+                        for instance in batch:
+                            instance_values = instance.get_values()
+                            values.append(instance._original_id)
+                            values.extend([instance_values[column] for column in columns])
+                        await client.query(
+                            connection, "execute", model._update_rows_query(columns, len(batch)),
+                            values, "flush_update", model,
+                        )
+
+                for model, instances in deletes.items():
+                    await client.query(
+                        connection, "execute", model._delete_ids_query(),
+                        [[instance._original_id for instance in instances]], "flush_delete", model,
+                    )
+
+            tables = {model.table_name for model, _ in inserts} | {model.table_name for model, _ in updates}
+            for table in tables | {model.table_name for model in deletes}:
+                await client.invalidate(table, connection)
+
+        for instances in [*inserts.values(), *updates.values()]:
+            for instance in instances:
+                instance._mark_saved()
+
+        for instance in self._deleted:
+            instance._saved = False
+        self._deleted = {}
+
+    def _batches(self, instances: List["Model"], width: int, size: int = None) -> Iterable[List["Model"]]:
+        size = size or max(1, min(self._batch_size, MAX_PARAMETERS // max(width, 1)))
+        for start in range(0, len(instances), size):
+            yield instances[start:start + size]
+
+    async def __aenter__(self) -> "Session":
+        self._token = _current_session.set(self)
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        _current_session.reset(self._token)
+        if exc_type is None:
+            await self.flush()
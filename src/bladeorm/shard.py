@@ -0,0 +1,132 @@
+from contextvars import ContextVar
+from functools import cmp_to_key
+from decimal import Decimal
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from .utils import DatabaseType, Operator, Order
+import math
+import zlib
+
+
+_current_shard: ContextVar[Optional[int]] = ContextVar("bladeorm_shard", default=None)
+
+
+def current_shard() -> Optional[int]:
+    return _current_shard.get()
+
+
+def shard_index(value: Any, count: int) -> int:
+    """
+    Returns the shard of a shard key value, stable across processes.
+    Equal numbers go to the same shard, e.g. 1, 1.0 and Decimal(1).
+    """
+    return zlib.crc32(repr(_normalize(value)).encode()) % count
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (bool, float, Decimal)) and (
+        value.is_finite() if isinstance(value, Decimal) else math.isfinite(value)
+    ):
+        if value == int(value):
+            return int(value)
+        if isinstance(value, Decimal):
+            return float(value)
+    return value
+
+
+def shard_values(where: Optional[Operator], key: DatabaseType) -> Optional[List[Any]]:
+    """
+    Returns the value the shard key is compared to with = in the AND-ed conditions
+    of a WHERE tree, None if the query can match any shard.
+    """
+    stack = [where]
+    while stack:
+        operator = stack.pop()
+        if not isinstance(operator, Operator) or isinstance(operator, DatabaseType):
+            continue
+        if operator.operator == "AND":
+            stack.extend([operator.first, operator.second])
+            continue
+        if operator.operator == "=":
+            for column, value in ((operator.first, operator.second), (operator.second, operator.first)):
+                if _is_key(column, key) and not isinstance(value, Operator):
+                    return [value]
+    return None
+
+
+def _is_key(column: Any, key: DatabaseType) -> bool:
+    return isinstance(column, DatabaseType) and column.shape() == key.shape()
+
+
+class ShardScope:
+    """
+    Runs the queries of a block on one shard, e.g. a transaction on the shard of a key.
+    """
+
+    def __init__(self, shard: int):
+        self._shard = shard
+        self._token = None
+
+    def __enter__(self) -> "ShardScope":
+        self._token = _current_shard.set(self._shard)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any):
+        _current_shard.reset(self._token)
+
+    async def __aenter__(self) -> "ShardScope":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        self.__exit__(exc_type, exc, traceback)
+
+
+async def on_shard(shard: int, call: Callable[[], Awaitable[Any]]) -> Any:
+    with ShardScope(shard):
+        return await call()
+
+
+async def iterate_on_shard(shard: int, iterator: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Iterates on a shard, the shard is set only while the iterator runs, not while the caller does.
+    """
+    try:
+        while True:
+            with ShardScope(shard):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        # closes the cursor of an iteration stopped early
+        with ShardScope(shard):
+            await iterator.aclose()
+
+
+def merge(parts: List[List[Any]], orders: Tuple[Order, ...], limit: int = None, offset: int = None) -> List[Any]:
+    """
+    Merges the results of the shards, sorted like ORDER BY, then applies offset and limit.
+    """
+    keys = []
+    for order in orders:
+        if not isinstance(order.expression, DatabaseType):
+            raise TypeError("Queries spanning shards can only be ordered by columns")
+        # PostgreSQL puts NULLs last ascending, first descending
+        nulls_first = order.nulls.lower() == "first" if order.nulls else order.descending
+        keys.append((order.expression.get_name(), order.descending, nulls_first))
+
+    def compare(first: Any, second: Any) -> int:
+        for name, descending, nulls_first in keys:
+            a, b = getattr(first, name), getattr(second, name)
+            if a == b:
+                continue
+            if a is None or b is None:
+                return (-1 if nulls_first else 1) * (1 if a is None else -1)
+            return (1 if a > b else -1) * (-1 if descending else 1)
+        return 0
+
+    results = [item for part in parts for item in part]
+    if keys and len(parts) > 1:
+        results.sort(key=cmp_to_key(compare))
+    start = offset or 0
+    return results[start:start + limit] if limit else results[start:]
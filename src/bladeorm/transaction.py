@@ -0,0 +1,106 @@
+from contextvars import ContextVar
+from typing import Any, Optional, Set, TYPE_CHECKING
+from .shard import current_shard
+
+if TYPE_CHECKING:
+    from .client import Client
+
+
+_current_transaction: ContextVar[Optional["Transaction"]] = ContextVar("bladeorm_transaction", default=None)
+
+
+class PinnedConnection:
+    """
+    Context manager handing out the connection pinned by a transaction, without releasing it.
+    """
+
+    def __init__(self, connection: Any):
+        self._connection = connection
+
+    async def __aenter__(self) -> Any:
+        return self._connection
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        pass
+
+
+class Transaction:
+    """
+    Pins one connection for every model operation run inside it.
+    Nested transactions become savepoints on the same connection.
+    The pinned connection must not be used by concurrent tasks.
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        isolation: str = None,
+        readonly: bool = False,
+        deferrable: bool = False,
+    ):
+        self._client = client
+        self._isolation = isolation
+        self._readonly = readonly
+        self._deferrable = deferrable
+
+        self._parent: Optional[Transaction] = None
+        self._acquire = None
+        self._connection = None
+        self._transaction = None
+        self._token = None
+
+        # tables written inside the transaction, invalidated again on commit
+        self._written: Set[str] = set()
+
+    @staticmethod
+    def current(client: "Client") -> Optional["Transaction"]:
+        transaction = _current_transaction.get()
+        return transaction if transaction is not None and transaction._client is client else None
+
+    @property
+    def connection(self) -> Any:
+        return self._connection
+
+    def written(self, table: str):
+        self._written.add(table)
+
+    async def __aenter__(self) -> "Transaction":
+        self._parent = Transaction.current(self._client)
+        if self._parent is not None:
+            self._connection = self._parent.connection
+        else:
+            if self._client.sharded and current_shard() is None:
+                raise TypeError("A transaction runs on one shard, open it inside client.on_shard")
+            self._acquire = self._client.admit(self._client.acquire())
+            self._connection = await self._acquire.__aenter__()
+
+        try:
+            self._transaction = self._connection.transaction(
+                isolation=self._isolation, readonly=self._readonly, deferrable=self._deferrable
+            )
+            await self._transaction.start()
+        except BaseException as e:
+            if self._acquire is not None:
+                await self._acquire.__aexit__(type(e), e, e.__traceback__)
+            raise
+
+        self._token = _current_transaction.set(self)
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any):
+        _current_transaction.reset(self._token)
+        try:
+            if exc_type is None:
+                await self._transaction.commit()
+            else:
+                await self._transaction.rollback()
+        finally:
+            if self._acquire is not None:
+                await self._acquire.__aexit__(exc_type, exc, traceback)
+
+        if exc_type is None:
+            if self._parent is not None:
+                self._parent._written |= self._written
+            else:
+                for table in self._written:
+                    await self._client.invalidate(table)
@@ -1,4 +1,11 @@
-from typing import Any, Type, Union, List, Tuple, Callable
+from typing import Any, Type, Union, List, Tuple, Callable, Hashable
+from collections import OrderedDict
+import hashlib
+import math
+
+
+# Placeholder for bound literals in query shapes
+PARAMETER = object()
 
 
 class ValuesManager:
@@ -13,7 +20,58 @@ class ValuesManager:
         return self._storage
 
 
+class LiteralValues(ValuesManager):
+    """
+    Renders values inline as SQL literals, for statements that can't take parameters (DDL).
+    """
+
+    def add(self, value: Any) -> str:
+        return literal(value)
+
+
+def literal(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int) or (isinstance(value, float) and math.isfinite(value)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return f"ARRAY[{','.join([literal(item) for item in value])}]"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class LRUCache:
+    def __init__(self, size: int = 512):
+        self._size = size
+        self._storage: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            self._storage.move_to_end(key)
+        except KeyError:
+            return default
+        return self._storage[key]
+
+    def set(self, key: Hashable, value: Any):
+        self._storage[key] = value
+        self._storage.move_to_end(key)
+        if len(self._storage) > self._size:
+            self._storage.popitem(last=False)
+
+    def clear(self):
+        self._storage.clear()
+
+    def __len__(self):
+        return len(self._storage)
+
+
 class Operator:
+    # shape and bound literals, computed once from the children when the node is built:
+    # expressions are never mutated afterwards, so shape() and bind() don't walk the tree
+    _shape: Tuple = None
+    _literals: Tuple = ()
+
     def __init__(
         self,
         first: Any,
@@ -28,6 +86,22 @@ class Operator:
         self.parenthesis = parenthesis
         self.no_first = no_first
 
+        # inlined, it runs for every node built, subclasses overwrite both after
+        if isinstance(second, Operator):
+            second_shape, second_literals = second._shape, second._literals
+        else:
+            second_shape, second_literals = PARAMETER, (second,)
+        if no_first:
+            self._shape = (operator, parenthesis, None, second_shape)
+            self._literals = second_literals
+            return
+        if isinstance(first, Operator):
+            first_shape, first_literals = first._shape, first._literals
+        else:
+            first_shape, first_literals = PARAMETER, (first,)
+        self._shape = (operator, parenthesis, first_shape, second_shape)
+        self._literals = first_literals + second_literals if first_literals else second_literals
+
     def build(
         self, values: ValuesManager = None
     ) -> Union[str, Tuple[str, ValuesManager]]:
@@ -46,6 +120,31 @@ class Operator:
         else:
             return result
 
+    def shape(self) -> Tuple:
+        """
+        Returns a hashable fingerprint of the expression, bound literals excluded.
+        :return Tuple:
+        """
+        return self._shape
+
+    def bind(self, values: List[Any]) -> List[Any]:
+        """
+        Appends the bound literals to values, in the same order as build.
+        :param values:
+        :return List[Any]:
+        """
+        values.extend(self._literals)
+        return values
+
+    def label(self, name: str) -> "Alias":
+        return Alias(self, name)
+
+    def asc(self, nulls: str = None) -> "Order":
+        return Order(self, False, nulls)
+
+    def desc(self, nulls: str = None) -> "Order":
+        return Order(self, True, nulls)
+
     def check_type(self, other):
         pass
 
@@ -128,24 +227,35 @@ class Operator:
 
 class DatabaseType(Operator):
     def __init__(
-        self, expected_type: Type, database_type: str, id_status: bool = False,  check: Callable[[Any], bool] = None
+        self, expected_type: Type, database_type: str, id_status: bool = False,  check: Callable[[Any], bool] = None, sql_type: str = None
     ):
         super().__init__(self, "", None)
         self._expected_type = expected_type
         self._database_type = database_type
+        self._sql_type = sql_type or database_type
         self._primary_key = False
         self.id_status = id_status
         self._table = None
         self._name = None
         self._default = None
         self._check = check
+        self._index: Index = None
+        self._reference: Reference = None
+        # set by initialize with the table and name
+        self._shape = (None, None)
+        self._literals = ()
 
     def clone(self) -> "DatabaseType":
-        return DatabaseType(self._expected_type, self._database_type, self.id_status)
+        new = DatabaseType(self._expected_type, self._database_type, self.id_status, self._check, self._sql_type)
+        new._primary_key = self._primary_key
+        new._index = self._index
+        new._reference = self._reference
+        return new
 
     def __getitem__(self, item) -> "DatabaseType":
         new = self.clone()
         new._database_type = f"{self._database_type}[{item}]"
+        new._sql_type = f"{self._sql_type}[{item}]"
         return new
 
     def check(self, check: Callable[[Any], bool]) -> "DatabaseType":
@@ -161,6 +271,7 @@ class DatabaseType(Operator):
     def array(self) -> "DatabaseType":
         new = self.clone()
         new._database_type = f"{self._database_type}[]"
+        new._sql_type = f"{self._sql_type}[]"
         return new
 
     @property
@@ -185,27 +296,66 @@ class DatabaseType(Operator):
         new._database_type = custom(self._database_type)
         return new
 
-    def __call__(self, size: int) -> "DatabaseType":
+    def __call__(self, size: int = None, **index: Any) -> "DatabaseType":
+        """
+        Sets the size of the type, e.g. Varchar(20), or the options of its index, e.g. Int.index(using="brin").
+        :param size:
+        :param index: Index options
+        :return DatabaseType:
+        """
+        new = self.clone()
+        if size is not None:
+            new._database_type = f"{self._database_type}({size})"
+            new._sql_type = f"{self._sql_type}({size})"
+        if index:
+            if not self._index:
+                raise TypeError("No index declared, use .index first")
+            new._index = Index(**index)
+        return new
+
+    @property
+    def index(self) -> "DatabaseType":
         new = self.clone()
-        new._database_type = f"{self._database_type}({size})"
+        new._index = Index()
         return new
 
+    def get_index(self) -> "Index":
+        return self._index
+
     def initialize(self, table: str, name: str, default: Any = None) -> "DatabaseType":
         new = self.clone()
         new._primary_key = self._primary_key
         new._check = self._check
         new._table = table
         new._name = name
+        new._shape = (table, name)
         new._default = default
+        if self._reference:
+            new._reference = self._reference.initialize(table, name)
         return new
 
-    def get_db_type(self):
+    def get_db_type(self, primary_key: bool = True):
+        """
+        :param primary_key: render PRIMARY KEY, False when it is a table constraint
+        """
         return (
-            f"{self._database_type} PRIMARY KEY"
-            if self._primary_key
-            else self._database_type
+            f"{self._database_type}"
+            f"{' PRIMARY KEY' if self._primary_key and primary_key else ''}"
+            f"{' ' + self._reference.get_sql() if self._reference else ''}"
         )
 
+    def is_primary_key(self) -> bool:
+        return self._primary_key
+
+    def get_reference(self) -> "Reference":
+        return self._reference
+
+    def get_sql_type(self):
+        """
+        Returns the bare SQL type, without constraints, usable in casts.
+        """
+        return self._sql_type
+
     def get_default(self):
         return self._default() if callable(self._default) else self._default
 
@@ -228,6 +378,9 @@ class DatabaseType(Operator):
     def build(self, _: ValuesManager = None) -> Union[str, Tuple[str, List[Any]]]:
         return f"{self._table}.{self._name}"
 
+    def bind(self, values: List[Any]) -> List[Any]:
+        return values
+
     def get_name(self):
         return self._name
 
@@ -242,3 +395,223 @@ class DatabaseType(Operator):
             raise TypeError(
                 f"Cannot compare {self._expected_type.__name__} with {type(other).__name__}"
             )
+
+
+class Raw(Operator):
+    """
+    Raw SQL fragment, NOT SQLI SAFE.
+    """
+
+    def __init__(self, sql: str):
+        super().__init__(None, sql, None)
+        self._shape = ("raw", sql)
+        self._literals = ()
+
+    def build(self, values: ValuesManager = None) -> Union[str, Tuple[str, ValuesManager]]:
+        return self.operator if values is not None else (self.operator, ValuesManager())
+
+
+class Alias(Operator):
+    """
+    expression AS name
+    """
+
+    def __init__(self, expression: Operator, name: str):
+        super().__init__(expression, "AS", name)
+        self._shape = ("alias", expression.shape(), name)
+        self._literals = expression._literals
+
+    def build(self, values: ValuesManager = None) -> Union[str, Tuple[str, ValuesManager]]:
+        return_values = values is None
+        if not values:
+            values = ValuesManager()
+        result = f"{self.first.build(values)} AS {self.second}"
+        return (result, values) if return_values else result
+
+
+class Function(Operator):
+    """
+    SQL function call, e.g. sum(users.age).
+    """
+
+    def __init__(self, name: str, *arguments: Any, distinct: bool = False):
+        super().__init__(None, name, None)
+        self.arguments = arguments
+        self.distinct = distinct
+        self._shape = ("function", name, distinct, tuple([shape(argument) for argument in arguments]))
+        self._literals = tuple([value for argument in arguments for value in literals(argument)])
+
+    def build(self, values: ValuesManager = None) -> Union[str, Tuple[str, ValuesManager]]:
+        return_values = values is None
+        if not values:
+            values = ValuesManager()
+        arguments = [
+            argument.build(values) if isinstance(argument, Operator) else values.add(argument)
+            for argument in self.arguments
+        ]
+        result = f"{self.operator}({'DISTINCT ' if self.distinct else ''}{','.join(arguments)})"
+        return (result, values) if return_values else result
+
+
+class Count(Function):
+    def __init__(self, column: Operator = None, distinct: bool = False):
+        super().__init__("count", column if column is not None else Raw("*"), distinct=distinct)
+
+
+class Sum(Function):
+    def __init__(self, column: Operator, distinct: bool = False):
+        super().__init__("sum", column, distinct=distinct)
+
+
+class Avg(Function):
+    def __init__(self, column: Operator, distinct: bool = False):
+        super().__init__("avg", column, distinct=distinct)
+
+
+class Min(Function):
+    def __init__(self, column: Operator):
+        super().__init__("min", column)
+
+
+class Max(Function):
+    def __init__(self, column: Operator):
+        super().__init__("max", column)
+
+
+class Order:
+    """
+    ORDER BY item, created with Operator.asc() and Operator.desc().
+    """
+
+    def __init__(self, expression: Operator, descending: bool = False, nulls: str = None):
+        self.expression = expression
+        self.descending = descending
+        self.nulls = nulls
+        self._shape = (expression.shape(), descending, nulls)
+
+    def build(self, values: ValuesManager) -> str:
+        return (
+            f"{self.expression.build(values)}"
+            f"{' DESC' if self.descending else ''}"
+            f"{' NULLS ' + self.nulls.upper() if self.nulls else ''}"
+        )
+
+    def shape(self) -> Tuple:
+        return self._shape
+
+    def bind(self, values: List[Any]) -> List[Any]:
+        return self.expression.bind(values)
+
+
+class Reference:
+    """
+    Target of a foreign key column, emitted as REFERENCES table(id).
+    related_name is the attribute holding the referenced instance,
+    reverse_name the one holding the list of referencing instances.
+    """
+
+    ON_DELETE = ("CASCADE", "SET NULL", "SET DEFAULT", "RESTRICT", "NO ACTION")
+
+    def __init__(self, model: Any, on_delete: str = None, related_name: str = None, reverse_name: str = None):
+        if on_delete is not None and on_delete.upper() not in Reference.ON_DELETE:
+            raise ValueError(f"on_delete must be one of {', '.join(Reference.ON_DELETE)}")
+        self.model = model
+        self.on_delete = on_delete.upper() if on_delete else None
+        self.related_name = related_name
+        self.reverse_name = reverse_name
+        # the model owning the foreign key, set when the model is created
+        self.source = None
+
+    def initialize(self, table: str, name: str) -> "Reference":
+        return Reference(
+            self.model,
+            self.on_delete,
+            self.related_name or (name[:-3] if name.endswith("_id") else f"{name}_related"),
+            self.reverse_name or table,
+        )
+
+    def get_sql(self) -> str:
+        return (
+            f"REFERENCES {self.model.table_name}({self.model._id.get_name()})"
+            f"{' ON DELETE ' + self.on_delete if self.on_delete else ''}"
+        )
+
+
+class Index:
+    """
+    Secondary index, emitted by Client.create_tables.
+    """
+
+    def __init__(
+        self,
+        *columns: Operator,
+        using: str = None,
+        where: Operator = None,
+        unique: bool = False,
+        name: str = None,
+        concurrently: bool = False,
+    ):
+        self._columns = columns
+        self._using = using
+        self._where = where
+        self._unique = unique
+        self._name = name
+        self._concurrently = concurrently
+        self._table = None
+
+    def initialize(self, table: str, *columns: Operator) -> "Index":
+        new = Index(
+            *(columns or self._columns),
+            using=self._using,
+            where=self._where,
+            unique=self._unique,
+            name=self._name,
+            concurrently=self._concurrently,
+        )
+        new._table = table
+        return new
+
+    def _build_columns(self) -> List[str]:
+        return [
+            column.get_name() if isinstance(column, DatabaseType) else f"({column.build(LiteralValues())})"
+            for column in self._columns
+        ]
+
+    def get_name(self) -> str:
+        if self._name:
+            return self._name
+
+        parts = [self._table]
+        parts.extend([column.get_name() if isinstance(column, DatabaseType) else "expr" for column in self._columns])
+        if self._using:
+            parts.append(self._using)
+        if self._where or not all([isinstance(column, DatabaseType) for column in self._columns]):
+            parts.append(hashlib.md5(self.get_sql().encode()).hexdigest()[:8])
+        # PostgreSQL truncates identifiers to 63 bytes
+        return f"{'_'.join(parts)[:59]}_idx"
+
+    def get_sql(self, name: str = None) -> str:
+        return (
+            f"CREATE {'UNIQUE ' if self._unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if self._concurrently else ''}"
+            f"{'IF NOT EXISTS ' + name + ' ' if name else ''}"
+            f"ON {self._table} "
+            f"{'USING ' + self._using + ' ' if self._using else ''}"
+            f"({', '.join(self._build_columns())})"
+            f"{' WHERE ' + self._where.build(LiteralValues()) if self._where else ''}"
+        )
+
+
+def shape(value: Any) -> Any:
+    return value.shape() if isinstance(value, Operator) else PARAMETER
+
+
+def literals(value: Any) -> Tuple:
+    return value._literals if isinstance(value, Operator) else (value,)
+
+
+def bind(value: Any, values: List[Any]) -> List[Any]:
+    if isinstance(value, Operator):
+        return value.bind(values)
+    values.append(value)
+    return values
@@ -0,0 +1,73 @@
+from typing import Any, Callable, List, Tuple
+
+
+class Transaction:
+    async def start(self):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        pass
+
+
+class Connection:
+    """
+    Records the queries it gets, results come from respond(method, query, args).
+    """
+
+    def __init__(self, respond: Callable[[str, str, Tuple[Any, ...]], Any] = None):
+        self.respond = respond or (lambda method, query, args: [] if method == "fetch" else "OK")
+        self.calls: List[Tuple[str, str, Tuple[Any, ...]]] = []
+
+    def transaction(self, **kwargs):
+        return Transaction()
+
+    async def _call(self, method: str, query: str, args: Tuple[Any, ...], kwargs: dict) -> Any:
+        self.calls.append((method, query, kwargs.get("records", args)))
+        return self.respond(method, query, args)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._call("fetch", query, args, kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._call("fetchrow", query, args, kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._call("execute", query, args, kwargs)
+
+    async def copy_records_to_table(self, table, **kwargs):
+        return await self._call("copy_records_to_table", table, (), kwargs)
+
+
+class Acquire:
+    def __init__(self, connection: Connection):
+        self._connection = connection
+
+    async def __aenter__(self):
+        return self._connection
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        pass
+
+
+class Pool:
+    def __init__(self, connection: Connection):
+        self._connection = connection
+
+    def acquire(self):
+        return Acquire(self._connection)
+
+
+def connect(client, connection: Connection):
+    """
+    Routes the queries of an unstarted client to connection.
+    """
+    client._pool = Pool(connection)
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from bladeorm.admission import Admission, QueryClass, Overloaded, AdmittedConnection
+
+
+class Manager:
+    async def __aenter__(self):
+        return "connection"
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        pass
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_default_class():
+    admission = Admission()
+    assert admission.get().name == "default"
+    with pytest.raises(ValueError):
+        admission.get("missing")
+
+
+def test_capacity_queues_and_releases():
+    async def main():
+        admission = Admission(capacity=1)
+        query_class = admission.get()
+        await admission.acquire(query_class)
+        waiting = asyncio.ensure_future(admission.acquire(query_class))
+        await asyncio.sleep(0)
+        assert not waiting.done() and query_class.queued == 1
+        admission.release(query_class)
+        await waiting
+        assert (admission.running, query_class.queued, query_class.admitted) == (1, 0, 2)
+
+    run(main())
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def main():
+        admission = Admission([QueryClass("batch", priority=1), QueryClass("web", priority=0)], capacity=1)
+        batch, web = admission.get("batch"), admission.get("web")
+        await admission.acquire(batch)
+        order = []
+
+        async def wait(query_class, name):
+            await admission.acquire(query_class)
+            order.append(name)
+            admission.release(query_class)
+
+        tasks = [
+            asyncio.ensure_future(wait(batch, "batch 1")),
+            asyncio.ensure_future(wait(web, "web 1")),
+            asyncio.ensure_future(wait(batch, "batch 2")),
+            asyncio.ensure_future(wait(web, "web 2")),
+        ]
+        await asyncio.sleep(0)
+        admission.release(batch)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["web 1", "web 2", "batch 1", "batch 2"]
+
+
+def test_class_limit_leaves_room_for_other_classes():
+    async def main():
+        admission = Admission([QueryClass("report", limit=1)], capacity=2)
+        report, default = admission.get("report"), admission.get()
+        await admission.acquire(report)
+        waiting = asyncio.ensure_future(admission.acquire(report))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(admission.acquire(default), 1)
+        assert not waiting.done()
+        admission.release(report)
+        await waiting
+        assert report.running == 1
+
+    run(main())
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        admission = Admission([QueryClass("web", max_queue=1)], capacity=1)
+        web = admission.get("web")
+        await admission.acquire(web)
+        waiting = asyncio.ensure_future(admission.acquire(web))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await admission.acquire(web)
+        waiting.cancel()
+        return web
+
+    web = run(main())
+    assert (web.shed, web.queued) == (1, 0)
+
+
+def test_max_wait_is_rejected():
+    async def main():
+        admission = Admission([QueryClass("web", max_wait=0.01)], capacity=1)
+        web = admission.get("web")
+        await admission.acquire(web)
+        with pytest.raises(Overloaded):
+            await admission.acquire(web)
+        return admission, web
+
+    admission, web = run(main())
+    assert (admission.running, web.queued, web.shed) == (1, 0, 1)
+
+
+def test_admitted_connection_releases_on_exit():
+    async def main():
+        admission = Admission(capacity=1)
+        query_class = admission.get()
+        with pytest.raises(RuntimeError):
+            async with AdmittedConnection(admission, query_class, Manager()) as connection:
+                assert connection == "connection" and admission.running == 1
+                raise RuntimeError
+        return admission
+
+    assert run(main()).running == 0
+
+
+def test_stats():
+    async def main():
+        admission = Admission(capacity=2)
+        await admission.acquire(admission.get())
+        return admission.stats()
+
+    stats = run(main())
+    assert (stats["running"], stats["capacity"]) == (1, 2)
+    assert stats["classes"]["default"]["admitted"] == 1
+    assert stats["classes"]["default"]["wait_max"] == 0.0
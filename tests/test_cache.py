@@ -0,0 +1,123 @@
+import asyncio
+
+from bladeorm import cache
+from bladeorm.cache import ResultCache, MISSING
+from bladeorm.client import Client
+from bladeorm.model import Text, Serial
+from bladeorm.query import ModelExecutor
+
+
+client = Client(result_cache=ResultCache())
+
+
+@client.model
+class User:
+    id: Serial.primary_key
+    name: Text
+
+
+def store(result_cache, key, tables=("users",), rows=None):
+    result_cache.set(key, tables, result_cache.generation(tables), [] if rows is None else rows)
+
+
+def test_get_returns_stored_rows():
+    result_cache = ResultCache()
+    key = ResultCache.key("SELECT * FROM users WHERE id=$1", (1,))
+    assert result_cache.get(key) is MISSING
+    store(result_cache, key, rows=[{"id": 1}])
+    assert result_cache.get(key) == [{"id": 1}]
+    assert (result_cache.hits, result_cache.misses) == (1, 1)
+
+
+def test_none_is_a_cached_result():
+    result_cache = ResultCache()
+    result_cache.set("key", ("users",), (0,), None)
+    assert result_cache.get("key") is None
+
+
+def test_unhashable_parameters_have_no_key():
+    assert ResultCache.key("SELECT $1", ([1, 2],)) is None
+    assert ResultCache.key("SELECT $1", (1,)) == ("SELECT $1", (1,))
+
+
+def test_lru_eviction():
+    result_cache = ResultCache(size=2)
+    store(result_cache, "a")
+    store(result_cache, "b")
+    result_cache.get("a")
+    store(result_cache, "c")
+    assert result_cache.get("b") is MISSING
+    assert result_cache.get("a") is not MISSING
+    assert result_cache.evictions == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    result_cache = ResultCache(ttl=10)
+    store(result_cache, "a")
+    now[0] = 105.0
+    assert result_cache.get("a") is not MISSING
+    now[0] = 111.0
+    assert result_cache.get("a") is MISSING
+    assert result_cache.stats["entries"] == 0
+
+
+def test_memory_cap():
+    rows = [{"name": "x" * 1000}]
+    result_cache = ResultCache(max_memory=cache._memory(rows) + 1)
+    store(result_cache, "a", rows=rows)
+    store(result_cache, "b", rows=rows)
+    assert result_cache.get("a") is MISSING
+    assert result_cache.get("b") is not MISSING
+    assert result_cache.memory == cache._memory(rows)
+
+    result_cache.set("c", ("users",), result_cache.generation(("users",)), rows * 10)
+    assert result_cache.get("c") is MISSING
+
+
+def test_invalidate_drops_the_table_entries():
+    result_cache = ResultCache()
+    store(result_cache, "users", ("users",))
+    store(result_cache, "joined", ("users", "posts"))
+    store(result_cache, "posts", ("posts",))
+    result_cache.invalidate("users")
+    assert result_cache.get("users") is MISSING
+    assert result_cache.get("joined") is MISSING
+    assert result_cache.get("posts") is not MISSING
+    assert result_cache.invalidations == 2
+    assert result_cache.memory == result_cache._storage["posts"][3]
+
+
+def test_set_skips_rows_read_before_a_write():
+    result_cache = ResultCache()
+    generation = result_cache.generation(("users",))
+    result_cache.invalidate("users")
+    result_cache.set("a", ("users",), generation, [])
+    assert result_cache.get("a") is MISSING
+
+
+def test_clear():
+    result_cache = ResultCache()
+    store(result_cache, "a", ("users",))
+    store(result_cache, "b", ("posts",))
+    result_cache.clear()
+    assert result_cache.stats["entries"] == 0
+    assert result_cache.memory == 0
+
+
+def test_primary_reads_skip_the_cache(monkeypatch):
+    async def run(self, operation, method, query, values, started, write=False):
+        return [self._using or "replica"]
+
+    monkeypatch.setattr(ModelExecutor, "_run", run)
+
+    async def main():
+        query, values = "SELECT * FROM users", []
+        first = await User._read("fetch", "fetch", query, values, 0.0)
+        primary = await User.using("primary")._read("fetch", "fetch", query, values, 0.0)
+        cached = await User._read("fetch", "fetch", query, values, 0.0)
+        return first, primary, cached
+
+    assert asyncio.run(main()) == (["replica"], ["primary"], ["replica"])
+    assert (client.result_cache.hits, client.result_cache.misses) == (1, 1)
@@ -0,0 +1,130 @@
+import asyncio
+
+from bladeorm.loader import Loader
+
+
+class Column:
+    def get_name(self):
+        return "id"
+
+
+class Model:
+    """
+    Stands in for a model, rows are dicts with an id.
+    """
+
+    def __init__(self, ids, error=None):
+        self.ids = set(ids)
+        self.error = error
+        self.batches = []
+
+    async def _fetch_any_rows(self, column, keys, name):
+        self.batches.append(sorted(keys))
+        if self.error is not None:
+            raise self.error
+        return [{"id": key} for key in keys if key in self.ids]
+
+    def from_record(self, row):
+        return dict(row)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_loads_share_one_batch():
+    model = Model(range(10))
+
+    async def main():
+        loader = Loader(model, Column())
+        return await asyncio.gather(*[loader.load(key) for key in (3, 1, 3, 2)])
+
+    assert run(main()) == [{"id": 3}, {"id": 1}, {"id": 3}, {"id": 2}]
+    assert model.batches == [[1, 2, 3]]
+
+
+def test_missing_and_none_keys_load_none():
+    model = Model([1])
+
+    async def main():
+        loader = Loader(model, Column())
+        return await asyncio.gather(loader.load(1), loader.load(5), loader.load(None))
+
+    assert run(main()) == [{"id": 1}, None, None]
+    assert model.batches == [[1, 5]]
+
+
+def test_max_batch_splits_batches():
+    model = Model(range(10))
+
+    async def main():
+        loader = Loader(model, Column(), max_batch=2)
+        return await asyncio.gather(*[loader.load(key) for key in range(5)])
+
+    assert run(main()) == [{"id": key} for key in range(5)]
+    assert model.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_sequential_loads_run_separate_batches():
+    model = Model(range(10))
+
+    async def main():
+        loader = Loader(model, Column())
+        await loader.load(1)
+        await loader.load(1)
+
+    run(main())
+    assert model.batches == [[1], [1]]
+
+
+def test_callers_get_their_own_instance():
+    model = Model([1])
+
+    async def main():
+        loader = Loader(model, Column())
+        return await asyncio.gather(loader.load(1), loader.load(1))
+
+    first, second = run(main())
+    assert first == second and first is not second
+
+
+def test_shared_loader_caches_instances():
+    model = Model([1])
+
+    async def main():
+        loader = Loader(model, Column(), shared=True)
+        first, second = await asyncio.gather(loader.load(1), loader.load(1))
+        third = await loader.load(1)
+        loader.clear()
+        fourth = await loader.load(1)
+        return first, second, third, fourth
+
+    first, second, third, fourth = run(main())
+    assert first is second is third
+    assert fourth == first and fourth is not first
+    assert model.batches == [[1], [1]]
+
+
+def test_errors_reach_every_caller():
+    model = Model([1], error=ValueError("boom"))
+
+    async def main():
+        loader = Loader(model, Column())
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    assert [type(result) for result in run(main())] == [ValueError, ValueError]
+
+
+def test_window_delays_the_batch():
+    model = Model(range(10))
+
+    async def main():
+        loader = Loader(model, Column(), window=0.01)
+        first = loader.load(1)
+        await asyncio.sleep(0)
+        second = loader.load(2)
+        return await asyncio.gather(first, second)
+
+    assert run(main()) == [{"id": 1}, {"id": 2}]
+    assert model.batches == [[1, 2]]
+
@@ -0,0 +1,59 @@
+import asyncio
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Serial
+
+import fakes
+
+
+client = Client()
+
+
+@client.model
+class User:
+    id: Serial.primary_key
+    name: Text
+    age: Int
+
+
+@client.model
+class Token:
+    id: Text.primary_key.default("gen_random_uuid()")
+    name: Text
+
+
+def test_records_have_no_dict():
+    record = User.from_record({"id": 1, "name": "a", "age": 2})
+    assert not hasattr(record, "__dict__")
+    assert (record.id, record.name, record.age) == (1, "a", 2)
+
+
+def test_record_updates_are_tracked():
+    record = User.from_record({"id": 1, "name": "a", "age": 2})
+    record.age = 3
+    assert record.get_values() == {"id": 1, "name": "a", "age": 3}
+    assert record._updated_columns == {"age": True}
+
+
+def test_insert_many_draws_missing_ids():
+    connection = fakes.Connection(lambda method, query, args: [(10,), (11,)] if method == "fetch" else "COPY 3")
+    fakes.connect(client, connection)
+    users = asyncio.run(User.insert_many([User(name="a", age=1), User(id=5, name="b", age=2), User(name="c", age=3)]))
+
+    (_, allocate, args), *copies = connection.calls
+    assert "pg_get_serial_sequence('users', 'id')" in allocate and args == (2,)
+    # one COPY per column order
+    assert [records for _, _, records in copies] == [[("a", 1, 10), ("c", 3, 11)], [(5, "b", 2)]]
+    assert [user.id for user in users] == [10, 5, 11]
+    assert all([user._saved and user._original_id == user.id for user in users])
+
+
+def test_insert_many_leaves_sql_default_ids_to_the_database():
+    # no id sequence, the allocation returns no rows
+    connection = fakes.Connection(lambda method, query, args: [] if method == "fetch" else "COPY 2")
+    fakes.connect(client, connection)
+    tokens = asyncio.run(Token.insert_many([Token(name="a"), Token(name="b")]))
+
+    assert connection.calls[1][2] == [("a",), ("b",)]
+    assert [token.get_values() for token in tokens] == [{"name": "a"}, {"name": "b"}]
+    assert not any([token._saved for token in tokens])
@@ -0,0 +1,99 @@
+import datetime
+
+import pytest
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Date, Serial
+from bladeorm.partition import RangePartition, ListPartition, HashPartition
+
+
+client = Client()
+
+
+@client.model
+class Event:
+    id: Serial.primary_key
+    name: Text
+    user_id: Int
+    day: Date
+
+
+def range_partition(interval="1 month", **kwargs):
+    return RangePartition(Event.day, interval=interval, **kwargs).initialize("events")
+
+
+def test_invalid_arguments():
+    with pytest.raises(TypeError):
+        RangePartition(Event.name)
+    for interval in ("month", "0 months", "2 fortnights", "-1 days"):
+        with pytest.raises(ValueError):
+            RangePartition(Event.day, interval=interval)
+    with pytest.raises(ValueError):
+        HashPartition(Event.user_id, 0)
+
+
+def test_floor():
+    day = datetime.date(2024, 5, 17)
+    assert range_partition("1 month").floor(day) == datetime.date(2024, 5, 1)
+    assert range_partition("3 months").floor(day) == datetime.date(2024, 4, 1)
+    assert range_partition("1 year").floor(day) == datetime.date(2024, 1, 1)
+    assert range_partition("10 years").floor(day) == datetime.date(2020, 1, 1)
+    assert range_partition("1 day").floor(day) == day
+    # 2024-05-13 is a Monday
+    assert range_partition("1 week").floor(day) == datetime.date(2024, 5, 13)
+    assert range_partition("1 week").floor(datetime.date(2024, 5, 13)) == datetime.date(2024, 5, 13)
+    assert range_partition("7 days").floor(day) == range_partition("1 week").floor(day)
+
+
+def test_floor_is_stable_across_intervals():
+    for interval in ("1 day", "3 days", "2 weeks", "1 month", "5 months", "2 years"):
+        partition = range_partition(interval)
+        day = datetime.date(2023, 1, 1)
+        while day < datetime.date(2025, 1, 1):
+            start = partition.floor(day)
+            assert start <= day < partition.shift(start, 1)
+            assert partition.floor(start) == start
+            day += datetime.timedelta(days=11)
+
+
+def test_shift():
+    partition = range_partition("1 month")
+    assert partition.shift(datetime.date(2024, 11, 1), 1) == datetime.date(2024, 12, 1)
+    assert partition.shift(datetime.date(2024, 11, 1), 2) == datetime.date(2025, 1, 1)
+    assert partition.shift(datetime.date(2024, 1, 1), -1) == datetime.date(2023, 12, 1)
+    assert range_partition("1 year").shift(datetime.date(2024, 1, 1), -2) == datetime.date(2022, 1, 1)
+    assert range_partition("2 weeks").shift(datetime.date(2024, 5, 13), 1) == datetime.date(2024, 5, 27)
+
+
+def test_window_and_expired():
+    partition = range_partition("1 month", ahead=2, retention=1)
+    today = datetime.date(2024, 5, 17)
+    assert partition.window(today) == [datetime.date(2024, 5, 1), datetime.date(2024, 6, 1), datetime.date(2024, 7, 1)]
+    assert partition.window(today, ahead=0, start=datetime.date(2024, 3, 9)) == [
+        datetime.date(2024, 3, 1), datetime.date(2024, 4, 1), datetime.date(2024, 5, 1),
+    ]
+    starts = [datetime.date(2024, month, 1) for month in range(1, 7)]
+    assert partition.expired(today, starts) == [datetime.date(2024, 1, 1), datetime.date(2024, 2, 1), datetime.date(2024, 3, 1)]
+    assert range_partition("1 month").expired(today, starts) == []
+
+
+def test_names_and_bounds():
+    partition = range_partition("1 month", default=True)
+    start = datetime.date(2024, 5, 1)
+    assert partition.name(start) == "events_p20240501"
+    assert partition.parse("events_p20240501") == start
+    assert partition.parse("events_default") is None
+    assert partition.parse("other_p20240501") is None
+    assert partition.bound(start) == "FOR VALUES FROM ('2024-05-01') TO ('2024-06-01')"
+    assert partition.partitions(datetime.date(2024, 5, 17))[-1] == ("events_default", "DEFAULT")
+    assert partition.get_sql() == "PARTITION BY RANGE (day)"
+
+
+def test_list_and_hash_partitions():
+    listed = ListPartition(Event.name, {"ab": ["a", "b"], "c": ["c"]}).initialize("events")
+    assert listed.partitions() == [("events_ab", "FOR VALUES IN ('a', 'b')"), ("events_c", "FOR VALUES IN ('c')")]
+    hashed = HashPartition(Event.user_id, 2).initialize("events")
+    assert hashed.partitions() == [
+        ("events_h0", "FOR VALUES WITH (MODULUS 2, REMAINDER 0)"),
+        ("events_h1", "FOR VALUES WITH (MODULUS 2, REMAINDER 1)"),
+    ]
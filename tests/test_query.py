@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+
+import pytest
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Float, Serial, Date
+from bladeorm.query import encode_cursor, decode_cursor
+from bladeorm.utils import ValuesManager, Raw, Sum, Count
+
+import fakes
+
+
+client = Client()
+
+
+@client.model
+class User:
+    id: Serial.primary_key
+    name: Text
+    age: Int
+    score: Float
+    born: Date
+
+
+def rebuild(executor, results=(), limit=None, offset=None):
+    """
+    Renders the query of fetch without the query cache.
+    """
+    manager = ValuesManager()
+    query = executor._select(
+        manager,
+        results,
+        lambda tail: (
+            f"{'LIMIT ' + tail.add(limit) if limit else ''} "
+            f"{'OFFSET ' + tail.add(offset) if offset else ''}"
+        ),
+    )
+    return query, manager.get_storage()
+
+
+def test_shape_ignores_literals():
+    assert (User.age > 1).shape() == (User.age > 2).shape()
+    assert ((User.name == "a") & (User.age < 3)).shape() == ((User.name == "b") & (User.age < 4)).shape()
+
+
+def test_shape_distinguishes_structure():
+    assert (User.age > 1).shape() != (User.age >= 1).shape()
+    assert (User.age > 1).shape() != (User.score > 1).shape()
+    assert (User.age > 1).shape() != (User.age > User.score).shape()
+    assert ((User.age > 1) & (User.age < 2)).shape() != ((User.age > 1) | (User.age < 2)).shape()
+    assert Raw("now()").shape() != Raw("random()").shape()
+    assert Sum(User.age).shape() != Sum(User.age, distinct=True).shape()
+
+
+def test_bind_follows_build_order():
+    expressions = [
+        User.age == 5,
+        (User.age > 1) & ((User.name == "a") | ~(User.score >= 2.5)),
+        -User.age < 3,
+        User.age * 2 + 1 > User.score - 4,
+        User.name >> "a%",
+        Sum(User.age + 7, distinct=True).label("total"),
+        Count(),
+    ]
+    for expression in expressions:
+        _, manager = expression.build()
+        assert expression.bind([]) == manager.get_storage()
+
+
+def test_fetch_query_matches_rebuild():
+    executors = [
+        User(User.id == 5),
+        User((User.age > 1) & ((User.name == "a") | (User.score < 2.5))),
+        User(User.age > 18).order_by((User.score * 3).desc(), User.name),
+        User(User.age > 18).group_by(User.age + 1),
+        User(User.age > 18).group_by(User.age + 1).order_by((User.age + 2).desc()),
+        User.order_by(User.age),
+    ]
+    results = ((), (User.name, (User.age * 2).label("double")), (Sum(User.score + 1).label("total"),))
+    for executor in executors:
+        for selected in results:
+            for limit, offset in ((None, None), (10, None), (10, 20), (None, 20)):
+                assert executor._fetch_query(selected, limit, offset) == rebuild(executor, selected, limit, offset)
+
+
+def test_fetch_query_reuses_the_compiled_query():
+    first, first_values = User(User.age > 1)._fetch_query(())
+    second, second_values = User(User.age > 2)._fetch_query(())
+    assert first is second
+    assert (first_values, second_values) == ([1], [2])
+
+
+def test_expressions_are_shared_between_queries():
+    condition = (User.age > 1) & (User.name == "a")
+    assert User(condition & (User.score < 2))._fetch_query(())[1] == [1, "a", 2]
+    assert User(condition)._fetch_query((), 5)[1] == [1, "a", 5]
+
+
+def paginate(executor, rows=(), after=None, size=2):
+    connection = fakes.Connection(lambda method, query, args: list(rows))
+    fakes.connect(client, connection)
+    page, token = asyncio.run(executor.paginate(after=after, size=size))
+    [(_, query, values)] = connection.calls
+    return page, token, query, values
+
+
+def test_paginate_appends_the_id_tie_breaker():
+    _, _, query, values = paginate(User(User.age > 1).order_by(User.age.desc()))
+    assert query.endswith("ORDER BY users.age DESC,users.id DESC LIMIT $2")
+    assert values == (1, 3)
+
+    _, _, query, _ = paginate(User.order_by(User.id))
+    assert query.endswith("ORDER BY users.id LIMIT $1")
+
+
+def test_paginate_compares_row_values_in_one_direction():
+    _, _, query, values = paginate(User(User.age > 1).order_by(User.age.desc()), after=encode_cursor([28, 2]))
+    assert "WHERE users.age > $1 AND ((users.age,users.id) < ($2,$3))" in query
+    assert values == (1, 28, 2, 3)
+
+    _, _, query, _ = paginate(User.order_by(User.age, User.name), after=encode_cursor([28, "a", 2]))
+    assert "WHERE ((users.age,users.name,users.id) > ($1,$2,$3))" in query
+
+
+def test_paginate_chains_mixed_directions():
+    after = encode_cursor([datetime.date(2000, 1, 2), "n", 2])
+    _, _, query, values = paginate(User.order_by(User.born.desc(), User.name), after=after)
+    assert (
+        "WHERE ((users.born<$1) OR (users.born=$1 AND users.name>$2) OR (users.born=$1 AND users.name=$2 AND users.id>$3))"
+    ) in query
+    assert values == (datetime.date(2000, 1, 2), "n", 2, 3)
+
+
+def test_paginate_returns_the_next_token():
+    rows = [{"id": day, "name": "n", "age": 30 - day, "score": 0.0, "born": datetime.date(2000, 1, day)} for day in (1, 2, 3)]
+    executor = User.order_by(User.born.desc(), User.name)
+
+    page, token, _, _ = paginate(executor, rows)
+    assert [user.id for user in page] == [1, 2]
+    assert decode_cursor(token, executor._keyset_order()) == [datetime.date(2000, 1, 2), "n", 2]
+
+    page, token, _, _ = paginate(executor, rows[:2])
+    assert len(page) == 2 and token is None
+
+
+def test_paginate_needs_column_order():
+    with pytest.raises(TypeError):
+        paginate(User(User.age > 1))
+    with pytest.raises(TypeError):
+        paginate(User.order_by((User.age + 1).desc()))
+
+
+def test_cursor_round_trip():
+    order = User.order_by(User.born, User.name, User.score)._keyset_order()
+    values = [datetime.date(2024, 2, 29), "a", 1.5, 7]
+    assert decode_cursor(encode_cursor(values), order) == values
+    assert decode_cursor(encode_cursor([None, None, None, 7]), order) == [None, None, None, 7]
+
+
+def test_invalid_cursors():
+    order = User.order_by(User.age)._keyset_order()
+    for token in ("not base64!", encode_cursor([1]), encode_cursor([1, 2, 3]), "e30=", "bm90IGpzb24="):
+        with pytest.raises(ValueError):
+            decode_cursor(token, order)
@@ -0,0 +1,125 @@
+import asyncio
+import re
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Serial
+
+import fakes
+
+
+client = Client()
+
+
+@client.model
+class User:
+    id: Serial.primary_key
+    name: Text
+    age: Int
+    note: Text
+
+
+@client.model
+class Token:
+    id: Text.primary_key.default("gen_random_uuid()")
+    name: Text
+
+
+def respond(ids=()):
+    """
+    Draws ids in order, none without ids like for a column without sequence,
+    and returns inserted rows in reverse, with the note SQL default.
+    """
+    ids = list(ids)
+
+    def call(method, query, args):
+        if "nextval" in query:
+            drawn, ids[:] = ids[:args[0]], ids[args[0]:]
+            return [(id,) for id in drawn]
+        if query.startswith("INSERT"):
+            columns = re.search(r"\((.*?)\)", query).group(1).split(",")
+            rows = [dict(zip(columns, args[start:start + len(columns)])) for start in range(0, len(args), len(columns))]
+            for row in rows:
+                row.setdefault("id", "generated")
+                row.setdefault("note", "default")
+            return rows[::-1]
+        return "OK"
+
+    return call
+
+
+def flush(connection, *instances, deleted=()):
+    fakes.connect(client, connection)
+
+    async def main():
+        async with client.session() as session:
+            session.add_all(instances)
+            for instance in deleted:
+                session.delete(instance)
+
+    asyncio.run(main())
+
+
+def test_inserts_are_grouped_by_column_set():
+    connection = fakes.Connection(respond([1, 2, 3]))
+    users = [User(name="a", age=1), User(name="b"), User(name="c", age=3)]
+    flush(connection, *users)
+
+    inserts = [(query, args) for method, query, args in connection.calls if query.startswith("INSERT")]
+    assert inserts == [
+        ("INSERT INTO users (name,age,id) VALUES ($1,$2,$3),($4,$5,$6) RETURNING *", ("a", 1, 1, "c", 3, 2)),
+        ("INSERT INTO users (name,id) VALUES ($1,$2) RETURNING *", ("b", 3)),
+    ]
+
+
+def test_returned_rows_map_back_by_id():
+    users = [User(name=name, age=age) for age, name in enumerate("abcd")]
+    flush(fakes.Connection(respond([7, 8, 9, 10])), *users)
+
+    assert [(user.id, user.name, user.note) for user in users] == [(7, "a", "default"), (8, "b", "default"), (9, "c", "default"), (10, "d", "default")]
+    assert all([user._saved and user._original_id == user.id for user in users])
+
+
+def test_sql_default_ids_insert_one_row_at_a_time():
+    connection = fakes.Connection(respond())
+    tokens = [Token(name="a"), Token(name="b")]
+    flush(connection, *tokens)
+
+    assert [args for method, query, args in connection.calls if query.startswith("INSERT")] == [("a",), ("b",)]
+    assert [(token.id, token.name) for token in tokens] == [("generated", "a"), ("generated", "b")]
+
+
+def test_flushed_changes_are_not_sent_again():
+    connection = fakes.Connection(respond([1]))
+    user = User(name="a")
+    user.age = 5
+    flush(connection, user)
+    calls = len(connection.calls)
+
+    assert user._updated_columns == {}
+    asyncio.run(user.save())
+    assert len(connection.calls) == calls
+
+
+def test_updates_and_deletes():
+    connection = fakes.Connection(respond())
+    users = [User.from_record({"id": id, "name": "x", "age": 1, "note": None}) for id in (1, 2, 3, 4)]
+    users[0].age = 10
+    users[1].age = 20
+    users[2].name = "y"
+    flush(connection, *users, deleted=[users[3]])
+
+    assert connection.calls == [
+        (
+            "execute",
+            "UPDATE users SET age=v.age FROM (VALUES ($1::INTEGER,$2::INTEGER),($3,$4)) AS v(_key,age) WHERE users.id=v._key",
+            (1, 10, 2, 20),
+        ),
+        (
+            "execute",
+            "UPDATE users SET name=v.name FROM (VALUES ($1::INTEGER,$2::TEXT)) AS v(_key,name) WHERE users.id=v._key",
+            (3, "y"),
+        ),
+        ("execute", "DELETE FROM users WHERE id=ANY($1)", ([4],)),
+    ]
+    assert not any([user._updated_columns for user in users])
+    assert not users[3]._saved
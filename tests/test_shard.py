@@ -0,0 +1,98 @@
+from decimal import Decimal
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Float, Serial
+from bladeorm.shard import shard_index, shard_values, merge
+
+
+client = Client()
+
+
+@client.model
+class Order:
+    id: Serial.primary_key
+    user_id: Int
+    note: Text
+    amount: Float
+
+
+Order.shard_by(Order.user_id)
+# routing only needs the shard count, no pool is reached
+client._shards = [None] * 4
+
+
+def rows(*values):
+    return [SimpleNamespace(amount=amount, note=note) for amount, note in values]
+
+
+def test_shard_index_is_stable():
+    assert shard_index("abc", 8) == shard_index("abc", 8)
+    assert {shard_index(value, 4) for value in range(100)} == {0, 1, 2, 3}
+
+
+def test_equal_numbers_go_to_one_shard():
+    for count in (2, 3, 7, 16):
+        assert len({shard_index(value, count) for value in (5, 5.0, Decimal(5), Decimal("5.00"))}) == 1
+        assert shard_index(True, count) == shard_index(1, count)
+        assert shard_index(2.5, count) == shard_index(Decimal("2.5"), count)
+    assert shard_index(float("nan"), 4) == shard_index(float("nan"), 4)
+
+
+def test_shard_values():
+    assert shard_values(Order.user_id == 3, Order.user_id) == [3]
+    assert shard_values((Order.amount > 1) & (Order.user_id == 3), Order.user_id) == [3]
+    assert shard_values(Order.user_id > 3, Order.user_id) is None
+    assert shard_values((Order.user_id == 3) | (Order.user_id == 4), Order.user_id) is None
+    assert shard_values(Order.user_id == Order.id, Order.user_id) is None
+    assert shard_values(None, Order.user_id) is None
+
+
+def test_merge_orders_limits_and_offsets():
+    parts = [rows((1, "a"), (4, "b")), rows((2, "c"), (3, "d"))]
+    assert [row.amount for row in merge(parts, (Order.amount.asc(),))] == [1, 2, 3, 4]
+    assert [row.amount for row in merge(parts, (Order.amount.desc(),), limit=2)] == [4, 3]
+    assert [row.amount for row in merge(parts, (Order.amount.asc(),), limit=2, offset=1)] == [2, 3]
+    assert [row.amount for row in merge(parts, (), offset=3)] == [3]
+
+
+def test_merge_ties_and_nulls():
+    parts = [rows((1, "b"), (None, "x")), rows((1, "a"), (2, "y"))]
+    assert [row.note for row in merge(parts, (Order.amount.asc(), Order.note.asc()))] == ["a", "b", "y", "x"]
+    assert [row.note for row in merge(parts, (Order.amount.desc(), Order.note.asc()))] == ["x", "y", "a", "b"]
+    assert [row.note for row in merge(parts, (Order.amount.asc("first"), Order.note.asc()))] == ["x", "a", "b", "y"]
+
+
+def test_merge_needs_column_orders():
+    with pytest.raises(TypeError):
+        merge([rows(), rows()], ((Order.amount * 2).asc(),))
+
+
+def test_serial_shard_key_is_rejected():
+    with pytest.raises(TypeError):
+        Order.shard_by(Order.id)
+
+
+def test_writes_need_the_shard_key():
+    async def write(call):
+        with pytest.raises(ValueError):
+            await call()
+
+    for call in (
+        lambda: Order.insert(Order(note="a")),
+        lambda: Order.insert_many([Order(user_id=1, note="a"), Order(note="b")]),
+        lambda: Order.upsert_rows([Order(note="a")], Order.id),
+        lambda: Order(note="a").upsert(Order.id),
+    ):
+        asyncio.run(write(call))
+
+
+def test_rows_are_grouped_by_shard():
+    orders = [Order(user_id=user_id) for user_id in range(20)]
+    groups = Order._by_shard(orders)
+    assert sorted([order for group in groups.values() for order in group], key=lambda order: order.user_id) == orders
+    for shard, group in groups.items():
+        assert {client.shard_for(order.user_id) for order in group} == {shard}
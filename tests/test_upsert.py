@@ -0,0 +1,105 @@
+import asyncio
+import re
+
+from bladeorm.client import Client
+from bladeorm.model import Text, Int, Serial
+
+import fakes
+
+
+client = Client()
+
+
+@client.model
+class Stock:
+    id: Serial.primary_key
+    sku: Text
+    team: Int
+    qty: Int
+
+
+def respond(skipped=()):
+    """
+    Returns the inserted rows in reverse with a new id, leaving out the skus in skipped like DO NOTHING.
+    """
+    ids = iter(range(100, 200))
+
+    def call(method, query, args):
+        columns = re.search(r"\((.*?)\)", query).group(1).split(",")
+        rows = [dict(zip(columns, args[start:start + len(columns)])) for start in range(0, len(args), len(columns))]
+        if method == "execute":
+            return f"INSERT 0 {len(rows)}"
+        rows = [{**row, "id": next(ids)} for row in rows if row["sku"] not in skipped]
+        return rows[::-1]
+
+    return call
+
+
+def upsert(call, connection):
+    fakes.connect(client, connection)
+    return asyncio.run(call())
+
+
+def test_last_row_of_a_key_wins():
+    connection = fakes.Connection(respond())
+    stocks = [Stock(sku="a", team=1, qty=1), Stock(sku="b", team=1, qty=2), Stock(sku="a", team=1, qty=3)]
+    upsert(lambda: Stock.upsert_many(stocks, [Stock.sku, Stock.team]), connection)
+
+    [(method, query, args)] = connection.calls
+    assert method == "fetch"
+    assert query == (
+        "INSERT INTO stocks (sku,team,qty) VALUES ($1,$2,$3),($4,$5,$6) "
+        "ON CONFLICT (sku,team) DO UPDATE SET qty=EXCLUDED.qty RETURNING *"
+    )
+    assert args == ("a", 1, 3, "b", 1, 2)
+    # every instance of a key gets the row
+    assert [(stock.id, stock.qty) for stock in stocks] == [(100, 3), (101, 2), (100, 3)]
+    assert all([stock._saved for stock in stocks])
+
+
+def test_batches_respect_batch_size():
+    connection = fakes.Connection(respond())
+    stocks = [Stock(sku=str(index), team=1, qty=index) for index in range(5)]
+    count = upsert(lambda: Stock.upsert_rows(stocks, Stock.sku, [Stock.qty], batch_size=2), connection)
+
+    assert count == 5
+    calls = connection.calls
+    assert [method for method, _, _ in calls] == ["execute"] * 3
+    assert [len(re.findall(r"\$\d+", query)) for _, query, _ in calls] == [6, 6, 3]
+    assert [len(args) for _, _, args in calls] == [6, 6, 3]
+    assert "DO UPDATE SET qty=EXCLUDED.qty" in calls[0][1] and "RETURNING" not in calls[0][1]
+
+
+def test_null_keys_are_not_deduplicated():
+    stocks = [Stock(sku="a", team=None, qty=1), Stock(sku="a", team=None, qty=2), Stock(sku="b", team=1, qty=3)]
+
+    connection = fakes.Connection(respond())
+    upsert(lambda: Stock.upsert_rows(stocks, [Stock.sku, Stock.team]), connection)
+    assert [args for _, _, args in connection.calls] == [("b", 1, 3), ("a", None, 1, "a", None, 2)]
+
+    # with RETURNING, rows without a key can't be matched, they are sent alone
+    connection = fakes.Connection(respond())
+    upsert(lambda: Stock.upsert_many(stocks, [Stock.sku, Stock.team]), connection)
+    assert [args for _, _, args in connection.calls] == [("b", 1, 3), ("a", None, 1), ("a", None, 2)]
+    assert [stock.id for stock in stocks] == [101, 102, 100]
+
+
+def test_rows_skipped_by_do_nothing_stay_unsaved():
+    connection = fakes.Connection(respond(skipped={"a"}))
+    stocks = [Stock(sku="a", team=1, qty=1), Stock(sku="b", team=1, qty=2)]
+    upsert(lambda: Stock.upsert_many(stocks, [Stock.sku, Stock.team], update=[]), connection)
+
+    [(_, query, _)] = connection.calls
+    assert "ON CONFLICT (sku,team) DO NOTHING RETURNING *" in query
+    assert stocks[0].get_values() == {"sku": "a", "team": 1, "qty": 1} and not stocks[0]._saved
+    assert stocks[1].id == 100 and stocks[1]._saved
+
+
+def test_upsert_reads_the_row_back():
+    connection = fakes.Connection(respond())
+    stock = Stock(sku="a", team=1, qty=1)
+    upsert(lambda: stock.upsert(Stock.sku, [Stock.qty]), connection)
+
+    [(_, query, args)] = connection.calls
+    assert query.endswith("ON CONFLICT (sku) DO UPDATE SET qty=EXCLUDED.qty RETURNING *")
+    assert (stock.id, stock._saved, stock._original_id) == (100, True, 100)